@@ -9,7 +9,11 @@ from dramatiq.worker import _WorkerThread
 from . import broker
 from .attachments import update_pdf_attachment
 from .database import db_context
-from .monitor import create_deliveries, send_meeting_emails, send_weekly_emails
+from .monitor import (
+    create_meeting_deliveries,
+    send_meeting_emails,
+    send_weekly_emails,
+)
 from .notifications import send_applicant_notifications
 from .postprocess import update_minute_search_vector, update_minute_with_entity_mentions
 
@@ -63,7 +67,7 @@ __all__ = [
     "update_minute_with_entity_mentions",
     "update_minute_search_vector",
     "update_pdf_attachment",
-    "create_deliveries",
+    "create_meeting_deliveries",
     "send_meeting_emails",
     "send_weekly_emails",
     "send_applicant_notifications",
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Session
 from . import ENV, config
 from .database import db_context
 from .models import Attachment, PDFAttachment
+from .page_cache import invalidate_pages
 
 pdf_page_pattern = re.compile(r"/Type\s*/Page([^s]|$)", re.MULTILINE | re.DOTALL)
 
@@ -58,6 +59,9 @@ def _update_pdf_attachment(attachment: Attachment, db: Session) -> None:
         )
     )
     db.commit()
+    # Minute pages show the PDF and are tagged with their meeting and case
+    minute = attachment.minute
+    invalidate_pages(("meeting", minute.meeting_id), ("case", minute.case_id))
 
 
 @dramatiq.actor
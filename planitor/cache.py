@@ -0,0 +1,154 @@
+"""A small key/value cache shared by the web processes when Redis is available.
+
+With `REDIS_URL` set values live in Redis so every web and worker process sees the
+same entries and invalidations. Without it (development, tests) each process has its
+own bounded in-memory cache and invalidations only reach the process that made them;
+entries from other processes expire with their TTL.
+
+Values must be JSON serializable.
+
+Whole groups of keys are invalidated by bumping a generation counter which is part
+of every key in the group:
+
+>>> key = cache.versioned_key("search", query)
+>>> cache.bump_generation("search")  # Any key made before this is now unreachable
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import redis
+
+from planitor import config
+
+REDIS_URL = config("REDIS_URL", default=None)
+CACHE_SIZE = config("CACHE_SIZE", cast=int, default=10_000)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # Counters are kept apart so that evicting entries never resets a generation
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._counters:
+                return str(self._counters[key])
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class RedisBackend:
+    def __init__(self, url: str):
+        self.redis = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.redis.get(key)
+        return None if value is None else value.decode()
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return [None if v is None else v.decode() for v in self.redis.mget(keys)]
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        self.redis.set(key, value, ex=ttl)
+
+    def incr(self, key: str) -> int:
+        return self.redis.incr(key)
+
+    def clear(self) -> None:
+        for key in self.redis.scan_iter("cache:*"):
+            self.redis.delete(key)
+
+
+class Cache:
+    """A cache that is down behaves like an empty cache, it never fails requests."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self.backend.get(f"cache:{key}")
+        except redis.RedisError as e:
+            logger.error(f"Cache read error: {e}")
+            return None
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        try:
+            self.backend.set(f"cache:{key}", json.dumps(value), ttl)
+        except redis.RedisError as e:
+            logger.error(f"Cache write error: {e}")
+
+    def get_generation(self, group: str) -> int:
+        try:
+            return int(self.backend.get(f"cache:generation:{group}") or 0)
+        except redis.RedisError as e:
+            logger.error(f"Cache read error: {e}")
+            return 0
+
+    def get_generations(self, groups: List[str]) -> Optional[List[int]]:
+        """The generations of several groups in one round trip, or None if the cache
+        is down. Unlike `get_generation` this tells a cache that is down apart from
+        groups that were never bumped."""
+        keys = [f"cache:generation:{group}" for group in groups]
+        try:
+            return [int(value or 0) for value in self.backend.get_many(keys)]
+        except redis.RedisError as e:
+            logger.error(f"Cache read error: {e}")
+            return None
+
+    def bump_generation(self, group: str) -> int:
+        try:
+            return self.backend.incr(f"cache:generation:{group}")
+        except redis.RedisError as e:
+            logger.error(f"Cache write error: {e}")
+            return 0
+
+    def versioned_key(self, group: str, key: str) -> str:
+        return f"{group}:{self.get_generation(group)}:{key}"
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+
+cache = Cache(RedisBackend(REDIS_URL) if REDIS_URL else MemoryBackend())
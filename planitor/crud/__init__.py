@@ -1,8 +1,10 @@
 from . import accounts, city, monitor  # noqa
 from .accounts import user  # noqa
 from .city import (
+    create_case_entities,
     create_minute,
     get_and_init_address,  # noqa
+    get_company_lookup_index,
     get_or_create_attachment,
     get_or_create_case,
     get_or_create_case_entity,
@@ -11,16 +13,18 @@ from .city import (
     get_or_create_meeting,
     get_or_create_municipality,
     levenshtein_company_lookup,
+    lookup_icelandic_companies_in_entities,
     lookup_icelandic_company_in_entities,
     search_addresses,
     search_entities,
     update_case_address,
+    update_case_minute_counts,
     update_case_status,
+    update_meeting_status_counts,
 )
 from .monitor import (
     create_address_subscription,  # noqa
     create_case_subscription,
-    create_delivery,
     create_entity_subscription,
     delete_address_subscription,
     delete_case_subscription,
@@ -28,7 +32,9 @@ from .monitor import (
     delete_subscription,
     get_address_subscription,
     get_case_subscription,
-    get_delivery,
     get_entity_subscription,
     get_or_create_search_subscription,
+    insert_deliveries,
+    set_search_query,
+    update_search_subscriptions,
 )
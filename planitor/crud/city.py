@@ -1,8 +1,10 @@
-from typing import Optional, Tuple, NamedTuple
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple, NamedTuple
 
 from iceaddr import iceaddr_lookup, iceaddr_suggest
 from iceaddr.addresses import _run_addr_query
-from sqlalchemy import func
+from sqlalchemy import String, cast, func
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from planitor.cases import get_case_status_from_remarks
@@ -26,8 +28,9 @@ from planitor.models import (
     Minute,
     Municipality,
 )
+from planitor.utils.fuzzy import TrigramIndex
 from planitor.utils.kennitala import Kennitala
-from planitor.utils.text import fold, slugify
+from planitor.utils.text import slugify
 
 MunicipalityAttributes = NamedTuple(
     "MunicipalityAttributes", name=str, osm_id=int, placenames=Tuple[str]
@@ -149,6 +152,24 @@ def get_or_create_case_entity(
     return case_entity, created
 
 
+def create_case_entities(
+    db: Session, case: Case, entities: Iterable[Entity], applicant: bool
+) -> None:
+    """Link entities to a case in one statement, skipping those already linked."""
+    values = [
+        {"case_id": case.id, "entity_id": entity.kennitala, "applicant": applicant}
+        for entity in entities
+    ]
+    if not values:
+        return
+    db.execute(
+        insert(CaseEntity)
+        .values(values)
+        .on_conflict_do_nothing(index_elements=["entity_id", "case_id"])
+    )
+    db.expire(case, ["entities"])
+
+
 def get_or_create_attachment(db, minute, url, **items) -> Tuple[Attachment, bool]:
     attachment = (
         db.query(Attachment)
@@ -190,10 +211,59 @@ def create_minute(db, meeting: Meeting, **items: dict) -> Minute:
         case.updated = meeting.start
         case.headline = minute.headline
 
+    # Incremented in SQL so that minutes added concurrently are all counted
+    case.minute_count = 1 if case_created else Case.minute_count + 1
+
     db.add(minute)
     return minute
 
 
+def update_meeting_status_counts(
+    db: Session, meeting_ids: Optional[Iterable[int]] = None
+) -> int:
+    """Recount the minutes of each status in the given meetings, or in all of them,
+    returning the number of meetings updated."""
+    status = func.coalesce(cast(Minute.status, String), "other")
+    counts = db.query(
+        Minute.meeting_id, status.label("status"), func.count(Minute.id).label("count")
+    )
+    if meeting_ids is not None:
+        counts = counts.filter(Minute.meeting_id.in_(list(meeting_ids)))
+    counts = counts.group_by(Minute.meeting_id, status).subquery()
+    rollup = (
+        db.query(
+            counts.c.meeting_id,
+            func.jsonb_object_agg(counts.c.status, counts.c.count).label("counts"),
+        )
+        .group_by(counts.c.meeting_id)
+        .subquery()
+    )
+    count = (
+        db.query(Meeting)
+        .filter(Meeting.id == rollup.c.meeting_id)
+        .update({Meeting.status_counts: rollup.c.counts}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+
+def update_case_minute_counts(db: Session) -> int:
+    """Recount the minutes of every case, returning the number of cases updated."""
+    minute_count = (
+        db.query(func.count(Minute.id))
+        .filter(Minute.case_id == Case.id)
+        .correlate(Case)
+        .as_scalar()
+    )
+    count = (
+        db.query(Case)
+        .filter(Case.minute_count != minute_count)
+        .update({Case.minute_count: minute_count}, synchronize_session=False)
+    )
+    db.commit()
+    return count
+
+
 # Just to be careful, list the keys we are interested in in case iceaddr adds new fields
 # which would not yet be columns on our side - in addition to dropping the x_isn93,
 # y_isn93 fields.
@@ -372,6 +442,29 @@ def lookup_icelandic_company_in_entities(db, name):
     )
 
 
+def lookup_icelandic_companies_in_entities(
+    db: Session, names: Iterable[str]
+) -> Dict[str, Entity]:
+    """Resolve many company names at once, with a single query on the lowercased name
+    index. Names that match no entity or more than one are left out, since with a name
+    collision we don’t know which one to pick."""
+    keys = {name: clean_company_name(name).lower() for name in names}
+    if not keys:
+        return {}
+    found = defaultdict(list)
+    lower_name = func.lower(Entity.name)
+    for entity, key in db.query(Entity, lower_name).filter(
+        Entity.entity_type == EntityTypeEnum.company,
+        lower_name.in_(set(keys.values())),
+    ):
+        found[key].append(entity)
+    return {
+        name: found[key][0]
+        for name, key in keys.items()
+        if len(found.get(key, ())) == 1
+    }
+
+
 MAX_LEVENSHTEIN_DISTANCE = 5
 
 
@@ -384,8 +477,23 @@ def levenshtein_company_lookup(db, name, max_distance=MAX_LEVENSHTEIN_DISTANCE):
     This is also useful for quick ranking of results for typing inputs that doesn’t
     require capital letters or accented characters.
 
+    Computing the distance to every entity is a full table scan, so candidates are
+    first picked with the pg_trgm `%` (similarity) operator, which can use the
+    `ix_entities_slug_trgm` index, and only those are ranked by distance.
+
     """
 
-    folded = clean_company_name(fold(name))
-    col = func.levenshtein_less_equal(Entity.slug, folded, max_distance)
-    return db.query(Entity, col).filter(col <= max_distance).order_by(col)
+    slug = slugify(name)
+    col = func.levenshtein_less_equal(Entity.slug, slug, max_distance)
+    return (
+        db.query(Entity, col)
+        # The pg_trgm `%` operator, doubled because psycopg2 uses `%` for parameters
+        .filter(Entity.slug.op("%%")(slug), col <= max_distance)
+        .order_by(col)
+    )
+
+
+def get_company_lookup_index(db) -> TrigramIndex:
+    """All entities in a `TrigramIndex` by slug, for matching many names offline the
+    same way `levenshtein_company_lookup` does."""
+    return TrigramIndex((entity.slug, entity) for entity in db.query(Entity))
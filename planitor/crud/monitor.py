@@ -1,6 +1,8 @@
-from typing import Tuple
+from typing import List, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Text, case, cast, func
+from sqlalchemy.dialects.postgresql import ARRAY, array, insert
+from sqlalchemy.orm import Query, Session
 
 from planitor.language.search import lemmatize_query
 from planitor.models import (
@@ -8,13 +10,55 @@ from planitor.models import (
     Case,
     Delivery,
     Entity,
-    Minute,
     Subscription,
     SubscriptionTypeEnum,
     User,
 )
 
 
+def get_search_lexemes(tsquery):
+    """Lexemes of which a minute has to contain at least one to match `tsquery`.
+
+    `querytree` strips the parts of the query that an index can not help with, such as
+    negated terms. When nothing is left it returns `T` and the lexemes are empty.
+    """
+    tree = func.querytree(tsquery)
+    return case(
+        [(tree == "T", cast(array([], type_=Text), ARRAY(Text)))],
+        else_=func.tsvector_to_array(func.to_tsvector("simple", tree)),
+    )
+
+
+def set_search_query(subscription: Subscription, search_query: str) -> None:
+    """Set the query of a search subscription along with its lemmatized and compiled
+    forms. The latter are SQL expressions and evaluated when the session flushes, so
+    that Postgres parses each query once instead of on every match."""
+    subscription.search_query = search_query
+    subscription.search_lemmas = lemmatize_query(search_query).lower()
+    tsquery = func.websearch_to_tsquery("simple", subscription.search_lemmas)
+    subscription.search_tsquery = tsquery
+    subscription.search_lexemes = get_search_lexemes(tsquery)
+
+
+def update_search_subscriptions(db: Session) -> int:
+    """Recompile the stored queries of all search subscriptions from their lemmas,
+    returning the number of subscriptions updated."""
+    tsquery = func.websearch_to_tsquery("simple", Subscription.search_lemmas)
+    count = (
+        db.query(Subscription)
+        .filter(Subscription.search_lemmas != None)  # noqa
+        .update(
+            {
+                Subscription.search_tsquery: tsquery,
+                Subscription.search_lexemes: get_search_lexemes(tsquery),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    return count
+
+
 def get_or_create_search_subscription(
     db: Session, user: User, search_query: str
 ) -> Tuple[Subscription, bool]:
@@ -27,32 +71,24 @@ def get_or_create_search_subscription(
     created = bool(subscription)
 
     if subscription is None:
-        subscription = Subscription(
-            user=user,
-            search_query=search_query,
-            search_lemmas=lemmatize_query(search_query).lower(),
-            type=SubscriptionTypeEnum.search,
-        )
+        subscription = Subscription(user=user, type=SubscriptionTypeEnum.search)
+        set_search_query(subscription, search_query)
         db.add(subscription)
 
     return subscription, created
 
 
-def create_delivery(
-    db: Session, subscription: Subscription, minute: Minute
-) -> Delivery:
-    delivery = Delivery(subscription=subscription, minute=minute)
-    db.add(delivery)
-    return delivery
-
-
-def get_delivery(db: Session, subscription: Subscription, minute: Minute) -> Delivery:
-    delivery = (
-        db.query(Delivery)
-        .filter(Delivery.subscription == subscription, Delivery.minute == minute)
-        .first()
+def insert_deliveries(db: Session, matches: Query) -> List[int]:
+    """Insert a delivery for every `(subscription_id, minute_id)` row of `matches` in
+    one statement and return the ids of the new ones. Pairs that already have a
+    delivery, e.g. when a worker retries, are skipped by the unique constraint."""
+    stmt = (
+        insert(Delivery)
+        .from_select(["subscription_id", "minute_id"], matches.statement)
+        .on_conflict_do_nothing(index_elements=["subscription_id", "minute_id"])
+        .returning(Delivery.id)
     )
-    return delivery
+    return [id for id, in db.execute(stmt)]
 
 
 def get_case_subscription(db: Session, user: User, case: Case):
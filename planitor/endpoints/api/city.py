@@ -1,13 +1,15 @@
 import datetime as dt
 from typing import List
 
-from fastapi import Depends, HTTPException, Request
-from sqlalchemy import func
+from fastapi import Depends, HTTPException, Request, Response
+from sqlalchemy import distinct, func
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 import skipulagsstofnun
 
 from planitor.crud.city import get_and_init_address
 from planitor.database import get_db
+from planitor.map_index import case_grid
 from planitor.models import (
     Address,
     Case,
@@ -17,7 +19,7 @@ from planitor.models import (
 )
 from planitor.schemas import city as schemas
 
-from ..utils import _get_entity
+from ..utils import _get_entity, _not_modified
 from . import router
 
 
@@ -32,6 +34,7 @@ def get_municipalities(
 @router.get("/addresses/{hnitnum}/addresses", response_model=schemas.MapCasesResponse)
 async def get_nearby_case_addresses(
     request: Request,
+    response: Response,
     hnitnum: int,
     radius: int = 500,
     days: int = 30,
@@ -58,30 +61,23 @@ async def get_nearby_case_addresses(
 
     dt_days_ago = dt.datetime.utcnow() - dt.timedelta(days=days)
 
-    filters = (
-        func.earth_distance(
-            func.ll_to_earth(address.lat_wgs84, address.long_wgs84),
-            func.ll_to_earth(Address.lat_wgs84, Address.long_wgs84),
-        )
-        < radius,
-        Case.updated > dt_days_ago,
+    # Answered from the in-process grid index instead of the database, see
+    # `planitor.map_index`. Rebuilding a stale grid reads every recent case, which
+    # must not block the event loop.
+    await run_in_threadpool(case_grid.refresh_if_stale, db)
+    locations = case_grid.query(
+        address.lat_wgs84, address.long_wgs84, radius, dt_days_ago, limit=100
     )
 
-    most_recent_nearby_addresses = (
-        db.query(Case.address_id, Case.id, Case.status, Case.updated)
-        .join(Address)
-        .distinct(Case.address_id)
-        .filter(*filters)
-        .order_by(Case.address_id, Case.updated.desc())
-    )
-    sq = most_recent_nearby_addresses.subquery()
-
-    query = (
-        db.query(Address, sq.c.status)
-        .select_from(Address)
-        .join(sq, sq.c.address_id == Address.hnitnum)
-        .order_by(sq.c.updated.desc())
+    # The locations are already in memory, it’s the plan lookup and serializing that
+    # map clients polling for changes can skip
+    not_modified = _not_modified(
+        request,
+        response,
+        [(loc.hnitnum, loc.updated, loc.status) for loc in locations],
     )
+    if not_modified is not None:
+        return not_modified
 
     polygon, plan = skipulagsstofnun.plans.get_plan(
         address.lat_wgs84, address.long_wgs84
@@ -98,22 +94,38 @@ async def get_nearby_case_addresses(
         ),
         "addresses": [
             dict(
-                lat=address.lat_wgs84,
-                lon=address.long_wgs84,
-                label=str(address),
-                status=status,
+                lat=location.lat,
+                lon=location.lon,
+                label=location.label,
+                status=location.status,
             )
-            for address, status in query.limit(100)
+            for location in locations
         ],
     }
 
 
 @router.get("/entities/{kennitala}/addresses", response_model=schemas.MapEntityResponse)
 async def get_entity_addresses(
-    request: Request, kennitala: str, db: Session = Depends(get_db)
+    request: Request, response: Response, kennitala: str, db: Session = Depends(get_db)
 ):
     entity = _get_entity(db, kennitala)
 
+    # Case status changes along with `Case.updated`, new cases and addresses change
+    # the counts
+    validators = (
+        db.query(
+            func.max(Case.updated),
+            func.count(Case.id),
+            func.count(distinct(Case.address_id)),
+        )
+        .join(CaseEntity)
+        .filter(CaseEntity.entity == entity)
+        .one()
+    )
+    not_modified = _not_modified(request, response, *validators)
+    if not_modified is not None:
+        return not_modified
+
     most_recent_addresses = (
         db.query(Case.address_id, func.max(Case.updated).label("last_updated"))
         .select_from(Case)
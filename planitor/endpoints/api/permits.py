@@ -3,9 +3,11 @@ from typing import List
 from fastapi import Depends, Request, Response
 from fastapi.exceptions import HTTPException
 from sqlakeyset.paging import get_page
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from planitor import models
+from planitor.cache import cache
 from planitor.database import get_db
 from planitor.models.enums import BuildingTypeEnum, PermitTypeEnum
 from planitor.schemas.permits import (
@@ -17,8 +19,13 @@ from planitor.schemas.permits import (
 from planitor.permits import PermitMinute
 from planitor.security import get_current_active_superuser
 
+from ..utils import _not_modified
 from . import router
 
+# Bumped when a permit is edited, which does not change the meeting dates or counts
+# that permit list ETags are derived from
+PERMITS_GENERATION = "api:permits"
+
 
 @router.get("/permits", response_model=List[ApiResponsePermit])
 def get_permits(
@@ -27,6 +34,19 @@ def get_permits(
     cursor: str = None,
     db: Session = Depends(get_db),
 ):
+    validators = (
+        db.query(func.max(models.Meeting.start), func.count(models.Permit.id))
+        .select_from(models.Permit)
+        .join(models.Minute)
+        .join(models.Meeting)
+        .one()
+    )
+    not_modified = _not_modified(
+        request, response, cache.get_generation(PERMITS_GENERATION), *validators
+    )
+    if not_modified is not None:
+        return not_modified
+
     query = (
         db.query(models.Permit)
         .join(models.Minute)
@@ -87,4 +107,5 @@ def update_permit(
     db.add(permit)
     db.commit()
     db.refresh(permit)
+    cache.bump_generation(PERMITS_GENERATION)
     return permit
@@ -1,16 +1,19 @@
+import asyncio
 import datetime as dt
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy import distinct, extract, func, and_
-from sqlalchemy.orm import Session
+from sqlalchemy import distinct, extract, func, and_, or_
+from sqlalchemy.orm import Session, contains_eager, joinedload
 from starlette.requests import Request
 import skipulagsstofnun
 
-from planitor import crud, hashids
+from planitor import crud, hashids, loading
 from planitor.database import get_db
+from planitor.geo import earth_point, within_radius
 from planitor.permits import PermitMinuteView
 from planitor.meetings import MeetingView
+from planitor.page_cache import NEW_MINUTES, PageCache
 from planitor.models import (
     Address,
     Case,
@@ -20,9 +23,10 @@ from planitor.models import (
     Meeting,
     Minute,
     Municipality,
+    SearchOrderEnum,
     User,
 )
-from planitor.search import MinuteResults
+from planitor.search import MinuteResults, run_blocking
 from planitor.security import get_current_active_user_or_none
 from planitor.templates import templates
 
@@ -37,21 +41,27 @@ async def get_search(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user_or_none),
     q: str = "",
-    page: int = 1,
+    page: str = None,
+    order: SearchOrderEnum = SearchOrderEnum.date,
 ):
-    if q:
-        results = MinuteResults(db, q, page)
-    else:
-        results = None
-
-    iceaddr_matches = crud.search_addresses(q)
-    entity_matches = crud.search_entities(db, q)
+    async def search_minutes_and_entities():
+        # These share the database session so they must not run concurrently
+        results = await MinuteResults.create(db, q, page, order) if q else None
+        entity_matches = await run_blocking(lambda: crud.search_entities(db, q).all())
+        return results, entity_matches
+
+    (results, entity_matches), iceaddr_matches = await asyncio.gather(
+        search_minutes_and_entities(),
+        run_blocking(crud.search_addresses, q),
+    )
 
     return templates.TemplateResponse(
         "search_results.html",
         {
             "request": request,
             "q": q,
+            "order": order,
+            "orders": SearchOrderEnum,
             "user": current_user,
             "results": results,
             "iceaddr_matches": iceaddr_matches,
@@ -168,7 +178,11 @@ async def get_meeting(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user_or_none),
 ):
-    meeting = db.query(Meeting).get(hashids.decode(meeting_id)[0])
+    meeting = (
+        db.query(Meeting)
+        .options(*loading.meeting_page())
+        .get(hashids.decode(meeting_id)[0])
+    )
     if (
         meeting is None
         or meeting.council.council_type.value != council_slug
@@ -176,38 +190,42 @@ async def get_meeting(
     ):
         raise HTTPException(status_code=404, detail="Fundargerð fannst ekki")
 
+    # Case minute counts are shown, so new minutes in any of the cases matter
+    case_ids = db.query(Minute.case_id).filter(Minute.meeting_id == meeting.id)
+    tags = [("meeting", meeting.id)] + [("case", id) for id, in case_ids]
+    page = PageCache(request, tags, current_user)
+    response = page.get()
+    if response is not None:
+        return response
+
     status_counts = (
         db.query(Minute.status, func.count(Minute.status))
         .group_by(Minute.status, Minute.meeting_id)
         .having(Minute.meeting_id == meeting.id)
     )
 
-    sq_count = (
-        db.query(Case.id, func.count(Minute.id).label("minute_count"))
-        .join(Minute, Case.id == Minute.case_id)
-        .group_by(Case.id)
-        .subquery()
-    )
-
     minutes = (
-        db.query(Minute, sq_count.c.minute_count)
+        db.query(Minute, Case.minute_count)
         .select_from(Minute)
         .filter(Minute.meeting_id == meeting.id)
-        .join(sq_count, sq_count.c.id == Minute.case_id)
+        .join(Case, Case.id == Minute.case_id)
+        .options(contains_eager(Minute.case))
         .order_by(Minute.id)
     )
 
-    return templates.TemplateResponse(
-        "meeting.html",
-        {
-            "municipality": meeting.council.municipality,
-            "status_counts": status_counts,
-            "council": meeting.council,
-            "meeting": meeting,
-            "minutes": minutes,
-            "request": request,
-            "user": current_user,
-        },
+    return page.set(
+        templates.TemplateResponse(
+            "meeting.html",
+            {
+                "municipality": meeting.council.municipality,
+                "status_counts": status_counts,
+                "council": meeting.council,
+                "meeting": meeting,
+                "minutes": minutes,
+                "request": request,
+                "user": current_user,
+            },
+        )
     )
 
 
@@ -229,19 +247,39 @@ async def get_case(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user_or_none),
 ):
-    case = db.query(Case).filter(Case.serial == case_id).first()
+    case = (
+        db.query(Case)
+        .options(*loading.case_page())
+        .filter(Case.serial == case_id)
+        .first()
+    )
     if case is None or case.municipality.slug != muni_slug:
         raise HTTPException(status_code=404, detail="Verk fannst ekki")
 
+    subscription = crud.get_case_subscription(db, current_user, case)
+
+    address_subscription = crud.get_address_subscription(db, current_user, case.iceaddr)
+
+    page = PageCache(
+        request,
+        [("case", case.id), ("address", case.address_id)],
+        current_user,
+        [bool(subscription), bool(address_subscription)],
+    )
+    response = page.get()
+    if response is not None:
+        return response
+
     minutes = (
         db.query(Minute)
+        .options(*loading.case_page_minutes())
         .join(Meeting)
         .filter(Minute.case_id == case.id)
         .order_by(Meeting.start.desc())
+        .all()
     )
 
-    last_minute = minutes.first()
-    last_updated = last_minute.meeting.start
+    last_updated = minutes[0].meeting.start
 
     if case.iceaddr is not None:
         related_cases = (
@@ -253,23 +291,21 @@ async def get_case(
     else:
         related_cases = []
 
-    subscription = crud.get_case_subscription(db, current_user, case)
-
-    address_subscription = crud.get_address_subscription(db, current_user, case.iceaddr)
-
-    return templates.TemplateResponse(
-        "case.html",
-        {
-            "municipality": case.municipality,
-            "case": case,
-            "minutes": minutes,
-            "request": request,
-            "user": current_user,
-            "last_updated": last_updated,
-            "related_cases": related_cases,
-            "subscription": subscription,
-            "address_subscription": address_subscription,
-        },
+    return page.set(
+        templates.TemplateResponse(
+            "case.html",
+            {
+                "municipality": case.municipality,
+                "case": case,
+                "minutes": minutes,
+                "request": request,
+                "user": current_user,
+                "last_updated": last_updated,
+                "related_cases": related_cases,
+                "subscription": subscription,
+                "address_subscription": address_subscription,
+            },
+        )
     )
 
 
@@ -295,50 +331,66 @@ def get_minute(
 ):
     # Minutes are available on both case and meeting pages but it’s nice to have
     # permalinks for each minute as well, for links.
-    minute = db.query(Minute).get(hashids.decode(minute_id)[0])
+    minute = (
+        db.query(Minute)
+        .options(*loading.minute_page())
+        .get(hashids.decode(minute_id)[0])
+    )
     if (
         minute is None
         or minute.case.serial != case_id
         or minute.case.municipality.slug != muni_slug
     ):
         raise HTTPException(status_code=404, detail="Bókun fannst ekki")
-    sq_count = (
-        db.query(func.count(Case.id).label("case_count"))
-        .filter(Case.id == minute.case_id)
-        .subquery()
-    )
-    minute, case_count = (
-        db.query(Minute, sq_count.c.case_count)
-        .select_from(Minute)
-        .filter(Minute.id == minute.id)
-        .first()
-    )
 
-    last_updated = (
-        db.query(Minute)
-        .join(Meeting)
-        .filter(Minute.case_id == minute.case.id)
-        .order_by(Meeting.start.desc())
-        .first()
-    ).meeting.start
+    case = minute.case
 
-    next_minute = (
-        db.query(Minute)
-        .filter(Minute.meeting == minute.meeting, Minute.id > minute.id)
-        .order_by(Minute.id)
-        .first()
-    )
+    subscription = crud.get_case_subscription(db, current_user, case)
 
-    previous_minute = (
-        db.query(Minute)
-        .filter(Minute.meeting == minute.meeting, Minute.id < minute.id)
-        .order_by(Minute.id.desc())
-        .first()
+    address_subscription = crud.get_address_subscription(db, current_user, case.iceaddr)
+
+    page = PageCache(
+        request,
+        [
+            ("meeting", minute.meeting_id),
+            ("case", case.id),
+            ("address", case.address_id),
+        ],
+        current_user,
+        [bool(subscription), bool(address_subscription)],
     )
+    response = page.get()
+    if response is not None:
+        return response
 
-    subscription = crud.get_case_subscription(db, current_user, minute.case)
+    # The minutes before and after this one in the meeting, in one query
+    neighbours = (
+        db.query(
+            Minute.id,
+            func.lag(Minute.id).over(order_by=Minute.id).label("previous_id"),
+            func.lead(Minute.id).over(order_by=Minute.id).label("next_id"),
+        )
+        .filter(Minute.meeting_id == minute.meeting_id)
+        .subquery()
+    )
+    previous_minute = next_minute = None
+    for neighbour in (
+        db.query(Minute)
+        .join(
+            neighbours,
+            or_(
+                Minute.id == neighbours.c.previous_id,
+                Minute.id == neighbours.c.next_id,
+            ),
+        )
+        .filter(neighbours.c.id == minute.id)
+        .options(joinedload(Minute.case))
+    ):
+        if neighbour.id < minute.id:
+            previous_minute = neighbour
+        else:
+            next_minute = neighbour
 
-    case = minute.case
     if case.iceaddr is not None:
         related_cases = (
             db.query(Case)
@@ -349,27 +401,28 @@ def get_minute(
     else:
         related_cases = []
 
-    address_subscription = crud.get_address_subscription(db, current_user, case.iceaddr)
-
-    return templates.TemplateResponse(
-        "minute.html",
-        {
-            "municipality": minute.meeting.council.municipality,
-            "council": minute.meeting.council,
-            "meeting": minute.meeting,
-            "minute": minute,
-            "case": case,
-            "case_count": case_count,
-            "request": request,
-            "user": current_user,
-            "headline": minute.headline,
-            "last_updated": last_updated,
-            "next_minute": next_minute,
-            "previous_minute": previous_minute,
-            "subscription": subscription,
-            "related_cases": related_cases,
-            "address_subscription": address_subscription,
-        },
+    return page.set(
+        templates.TemplateResponse(
+            "minute.html",
+            {
+                "municipality": minute.meeting.council.municipality,
+                "council": minute.meeting.council,
+                "meeting": minute.meeting,
+                "minute": minute,
+                "case": case,
+                "case_count": case.minute_count,
+                "request": request,
+                "user": current_user,
+                "headline": minute.headline,
+                # The start of the most recent meeting about the case
+                "last_updated": case.updated,
+                "next_minute": next_minute,
+                "previous_minute": previous_minute,
+                "subscription": subscription,
+                "related_cases": related_cases,
+                "address_subscription": address_subscription,
+            },
+        )
     )
 
 
@@ -392,26 +445,29 @@ async def get_address(
     if _db_address is not None:
         address = _db_address
 
-    def get_query(filters):
-        sq = (
-            db.query(Case.id, func.count(Minute.id).label("minute_count"))
-            .join(Address)
-            .join(Minute, Case.id == Minute.case_id)
-            .filter(*filters)
-            .group_by(Case.id)
-            .subquery()
-        )
+    subscription = crud.get_address_subscription(db, current_user, address)
 
+    # Nearby cases are listed too, so any new minute can change this page
+    page = PageCache(
+        request,
+        [("address", hnitnum), NEW_MINUTES],
+        current_user,
+        [bool(subscription)],
+    )
+    response = page.get()
+    if response is not None:
+        return response
+
+    def get_query(filters):
         return (
             db.query(
                 Case,
                 extract("year", Case.updated),
-                sq.c.minute_count,
+                Case.minute_count,
             )
             .select_from(Case)
             .outerjoin(Address)
-            .filter(*filters)
-            .join(sq, sq.c.id == Case.id)
+            .filter(*filters, Case.minute_count > 0)
             .order_by(Case.updated.desc())
         )
 
@@ -431,38 +487,38 @@ async def get_address(
 
     nearby_cases = get_query(
         (
-            func.earth_distance(
-                func.ll_to_earth(address.lat_wgs84, address.long_wgs84),
-                func.ll_to_earth(Address.lat_wgs84, Address.long_wgs84),
-            )
-            < radius,
+            within_radius(
+                earth_point(address.lat_wgs84, address.long_wgs84),
+                earth_point(Address.lat_wgs84, Address.long_wgs84),
+                radius,
+            ),
             Case.updated > dt_days_ago,
             Address.hnitnum != hnitnum,
         )
     )
 
-    subscription = crud.get_address_subscription(db, current_user, address)
-
     polygon, plan = None, None
     if address:
         polygon, plan = skipulagsstofnun.plans.get_plan(
             address.lat_wgs84, address.long_wgs84
         )
 
-    return templates.TemplateResponse(
-        "address.html",
-        {
-            "address": address,
-            "cases": cases.all(),
-            "nearby_cases": nearby_cases.limit(100).all(),
-            "request": request,
-            "user": current_user,
-            "radius": radius,
-            "days": days,
-            "subscription": subscription,
-            "polygon": polygon,
-            "plan": plan,
-        },
+    return page.set(
+        templates.TemplateResponse(
+            "address.html",
+            {
+                "address": address,
+                "cases": cases.all(),
+                "nearby_cases": nearby_cases.limit(100).all(),
+                "request": request,
+                "user": current_user,
+                "radius": radius,
+                "days": days,
+                "subscription": subscription,
+                "polygon": polygon,
+                "plan": plan,
+            },
+        )
     )
 
 
@@ -485,39 +541,38 @@ async def get_company(
             "company_paywall.html", {"request": request, "entity": entity}
         )
 
-    sq_count = (
-        db.query(Case.id, func.count(Minute.id).label("minute_count"))
-        .join(CaseEntity)
-        .filter(CaseEntity.entity == entity)
-        .join(Minute, Case.id == Minute.case_id)
-        .group_by(Case.id)
-        .subquery()
+    subscription = crud.get_entity_subscription(db, current_user, entity)
+
+    page = PageCache(
+        request, [("entity", entity.kennitala)], current_user, [bool(subscription)]
     )
+    response = page.get()
+    if response is not None:
+        return response
 
     cases = (
         db.query(
             Case,
             extract("year", Case.updated),
-            sq_count.c.minute_count,
+            Case.minute_count,
         )
         .select_from(Case)
         .join(CaseEntity)
-        .filter(CaseEntity.entity == entity)
-        .join(sq_count, sq_count.c.id == Case.id)
+        .filter(CaseEntity.entity == entity, Case.minute_count > 0)
         .order_by(Case.updated.desc())
     )
 
-    subscription = crud.get_entity_subscription(db, current_user, entity)
-
-    return templates.TemplateResponse(
-        "company.html",
-        {
-            "entity": entity,
-            "cases": cases,
-            "request": request,
-            "user": current_user,
-            "subscription": subscription,
-        },
+    return page.set(
+        templates.TemplateResponse(
+            "company.html",
+            {
+                "entity": entity,
+                "cases": cases,
+                "request": request,
+                "user": current_user,
+                "subscription": subscription,
+            },
+        )
     )
 
 
@@ -1,7 +1,14 @@
-from fastapi import HTTPException
+from typing import Any, Optional
+
+from fastapi import HTTPException, Request, Response
 from sqlalchemy.orm import Session
 
+from planitor import config
 from planitor.models import Entity
+from planitor.page_cache import etag_matches, get_etag
+
+# How long clients and CDNs may use JSON API responses before revalidating them
+API_CACHE_MAX_AGE = config("API_CACHE_MAX_AGE", cast=int, default=60)
 
 
 def _get_entity(db: Session, kennitala: str, slug: str = None) -> Entity:
@@ -9,3 +16,16 @@ def _get_entity(db: Session, kennitala: str, slug: str = None) -> Entity:
     if entity is None or (slug is not None and entity.slug != slug):
         raise HTTPException(status_code=404, detail="Kennitala fannst ekki")
     return entity
+
+
+def _not_modified(
+    request: Request, response: Response, *validators: Any
+) -> Optional[Response]:
+    """Give `response` an ETag derived from `validators`, everything the response
+    body depends on, and return a 304 response if the client already has it."""
+    etag = get_etag(request.url.path, request.url.query, *validators)
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={API_CACHE_MAX_AGE}"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -3,6 +3,7 @@ from typing import Optional, Tuple
 
 from iceaddr import iceaddr_lookup
 from iceaddr.addresses import _cap_first
+from sqlalchemy import and_, func
 
 
 def get_housenumber(string):
@@ -68,3 +69,22 @@ def lookup_address(
             # because of a serheiti lookup like "Harpa"
             return None
         return match[0]
+
+
+def earth_point(lat, lon):
+    """The earthdistance point of a latitude and longitude. For columns this is the
+    same expression as the GiST index on `Address` so Postgres can use it."""
+    return func.ll_to_earth(lat, lon)
+
+
+def within_radius(origin, point, radius):
+    """Filter on `point` being within `radius` meters of `origin`, both made with
+    `earth_point`.
+
+    The `earth_box` containment is answered by the GiST index but also lets through
+    the corners of the box, `earth_distance` then keeps only points within the radius.
+    """
+    return and_(
+        func.earth_box(origin, radius).op("@>")(point),
+        func.earth_distance(origin, point) < radius,
+    )
@@ -0,0 +1,225 @@
+"""Bulk (re)indexing of minutes for full text search.
+
+`postprocess.update_minute_search_vector` indexes one minute at a time, which is fine
+for freshly scraped meetings but far too slow to rebuild the whole index. This module
+streams minute ids with keyset pagination (newest first) and for each batch:
+
+1.  Loads the minutes with their case, address, entities and responses eagerly.
+2.  Skips minutes whose `index_hash` matches, i.e. where neither the document, the
+    case terms nor the index version changed since they were last indexed.
+3.  Lemmatizes the remaining documents concurrently over the pooled lemma API session.
+4.  Writes their search vectors back with a single `UPDATE ... FROM (VALUES ...)`.
+
+After every committed batch the last minute id is written to a checkpoint file so an
+interrupted run can pick up where it stopped. If the lemma API fails the batch is
+neither written nor checkpointed and the run stops, to be resumed later. A checkpoint
+is only resumed by a run with the same `force` setting.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from psycopg2.extras import execute_values
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from planitor.language.lemma_api import MAX_WORKERS, lemmatize_texts
+from planitor.language.search import filter_lemmas
+from planitor.minutes import (
+    IGNORE,
+    get_minute_extra_terms,
+    get_minute_index_hash,
+    get_minute_text,
+)
+from planitor.models import Case, CaseEntity, Minute
+from planitor.search import invalidate_search_cache
+
+BATCH_SIZE = 200
+
+UPDATE_SQL = """
+    UPDATE minutes
+    SET
+        search_vector = to_tsvector('simple', v.document),
+        lemmas = v.lemmas,
+        index_hash = v.index_hash
+    FROM (VALUES %s) AS v (id, document, lemmas, index_hash)
+    WHERE minutes.id = v.id
+"""
+
+SearchVectorRow = Tuple[int, str, str, str]
+
+
+def iter_minute_id_batches(
+    db: Session, batch_size: int = BATCH_SIZE, before_id: Optional[int] = None
+) -> Iterator[List[int]]:
+    """Yield minute ids in descending batches, seeking past the last id of the
+    previous batch instead of using offsets."""
+    while True:
+        query = db.query(Minute.id)
+        if before_id is not None:
+            query = query.filter(Minute.id < before_id)
+        ids = [id for id, in query.order_by(Minute.id.desc()).limit(batch_size)]
+        if not ids:
+            return
+        yield ids
+        before_id = ids[-1]
+
+
+def load_minutes(db: Session, ids: Sequence[int]) -> List[Minute]:
+    return (
+        db.query(Minute)
+        .filter(Minute.id.in_(ids))
+        .options(
+            joinedload(Minute.case).joinedload(Case.iceaddr),
+            selectinload(Minute.case)
+            .selectinload(Case.entities)
+            .joinedload(CaseEntity.entity),
+            selectinload(Minute.responses),
+        )
+        .order_by(Minute.id.desc())
+        .all()
+    )
+
+
+def get_stale_minutes(
+    minutes: Sequence[Minute], force: bool = False
+) -> List[Tuple[Minute, str]]:
+    """Return `(minute, index_hash)` for minutes that need to be reindexed."""
+    stale = []
+    for minute in minutes:
+        index_hash = get_minute_index_hash(minute)
+        if force or minute.index_hash != index_hash:
+            stale.append((minute, index_hash))
+    return stale
+
+
+def get_search_vector_rows(
+    stale: Sequence[Tuple[Minute, str]], max_workers: int = MAX_WORKERS
+) -> List[SearchVectorRow]:
+    """Lemmatize minutes concurrently and return `(id, document, lemmas, index_hash)`
+    rows in the same shape as `postprocess._update_minute_search_vector` would write
+    them. Raises if any of the documents fails to lemmatize."""
+    # Everything touching the ORM stays in this thread, only HTTP goes to the pool
+    texts = [get_minute_text(minute) for minute, _ in stale]
+    extra_terms = [get_minute_extra_terms(minute) for minute, _ in stale]
+    rows = []
+    for (minute, index_hash), lemmas, extra in zip(
+        stale, lemmatize_texts(texts, max_workers, raise_errors=True), extra_terms
+    ):
+        lemmas = list(filter_lemmas(lemmas, IGNORE)) + extra
+        rows.append((minute.id, " ".join(lemmas), ", ".join(lemmas), index_hash))
+    return rows
+
+
+def write_search_vectors(db: Session, rows: Sequence[SearchVectorRow]) -> None:
+    if not rows:
+        return
+    cursor = db.connection().connection.cursor()
+    execute_values(cursor, UPDATE_SQL, rows, page_size=len(rows))
+
+
+class Checkpoint:
+    """The id of the last indexed minute and whether the run was forced, persisted
+    as JSON."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def load(self) -> dict:
+        if not self.path.exists():
+            return {}
+        return json.loads(self.path.read_text())
+
+    def save(self, last_id: int, done: int, indexed: int, force: bool = False) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        state = {"last_id": last_id, "done": done, "indexed": indexed, "force": force}
+        tmp.write_text(json.dumps(state))
+        tmp.replace(self.path)
+
+    def clear(self) -> None:
+        if self.path.exists():
+            self.path.unlink()
+
+
+class Progress:
+    """`done` and `indexed` count from the start of the first, possibly interrupted,
+    run while `scanned` and the rate only cover this run."""
+
+    def __init__(self, total: int, done: int = 0, indexed: int = 0):
+        self.total = total
+        self.done = done
+        self.indexed = indexed
+        self.scanned = 0
+        self.started = time.monotonic()
+
+    def update(self, scanned: int, indexed: int) -> None:
+        self.done += scanned
+        self.scanned += scanned
+        self.indexed += indexed
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.scanned / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        if not self.rate:
+            return None
+        return max(self.total - self.scanned, 0) / self.rate
+
+    def __str__(self):
+        eta = (
+            "?"
+            if self.eta is None
+            else time.strftime("%H:%M:%S", time.gmtime(self.eta))
+        )
+        return (
+            f"{self.done} scanned, {self.indexed} reindexed, "
+            f"{self.rate:.1f} docs/sec, ETA {eta}"
+        )
+
+
+def reindex_minutes(
+    db: Session,
+    force: bool = False,
+    limit: int = 0,
+    batch_size: int = BATCH_SIZE,
+    max_workers: int = MAX_WORKERS,
+    checkpoint: Optional[Checkpoint] = None,
+    on_batch: Callable[[List[int], Progress], None] = None,
+) -> Progress:
+    state = checkpoint.load() if checkpoint else {}
+    if state.get("force", False) != force:
+        # A forced run must not skip minutes a previous unforced run found unchanged
+        state = {}
+    before_id = state.get("last_id")
+
+    total_query = db.query(Minute.id)
+    if before_id is not None:
+        total_query = total_query.filter(Minute.id < before_id)
+    total = total_query.count()
+    if limit > 0:
+        total = min(total, limit)
+    progress = Progress(total, state.get("done", 0), state.get("indexed", 0))
+
+    for ids in iter_minute_id_batches(db, batch_size, before_id):
+        if limit > 0:
+            ids = ids[: limit - progress.scanned]
+        stale = get_stale_minutes(load_minutes(db, ids), force)
+        write_search_vectors(db, get_search_vector_rows(stale, max_workers))
+        db.commit()
+        if stale:
+            invalidate_search_cache()
+        progress.update(len(ids), len(stale))
+        if checkpoint:
+            checkpoint.save(ids[-1], progress.done, progress.indexed, force)
+        if on_batch:
+            on_batch(ids, progress)
+        if limit > 0 and progress.scanned >= limit:
+            return progress
+
+    if checkpoint:
+        checkpoint.clear()
+    return progress
@@ -3,13 +3,22 @@ HTTP client for lemma.solberg.is - Icelandic lemmatization API.
 
 This replaces the heavy Greynir-based lemmatization with a lightweight HTTP API,
 significantly reducing memory usage in worker processes.
+
+All requests go through one pooled `requests.Session` so that keep-alive connections
+are reused between calls instead of paying a TCP+TLS handshake per minute or per query
+word. Transient failures (connection errors, 429 and 5xx responses) are retried with
+exponential backoff by the transport adapter.
 """
 
 import logging
 import os
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Iterable, List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +26,11 @@ LEMMA_API_URL = "https://lemma.solberg.is"
 LEMMA_API_KEY = os.environ.get("LEMMA_API_KEY")  # Optional: bypasses rate limiting
 TIMEOUT = 30  # seconds
 
+BATCH_SIZE = 1000  # API limit of words per /api/batch request
+MAX_WORKERS = int(os.environ.get("LEMMA_API_MAX_WORKERS", 8))  # Concurrent requests
+RETRIES = 3
+BACKOFF_FACTOR = 0.5  # Sleeps 0.5s, 1s, 2s between retries
+
 
 def _get_headers() -> dict:
     """Get request headers, including API key if configured."""
@@ -26,53 +40,106 @@ def _get_headers() -> dict:
     return headers
 
 
-def lemmatize_text(text: str) -> List[str]:
+def _get_retry() -> Retry:
+    options = dict(
+        total=RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 500, 502, 503, 504),
+        raise_on_status=False,
+    )
+    # POST is not retried by default. Lemmatization is idempotent so it is safe.
+    try:
+        return Retry(allowed_methods=frozenset(["POST"]), **options)
+    except TypeError:  # urllib3 < 1.26
+        return Retry(method_whitelist=frozenset(["POST"]), **options)
+
+
+def _create_session() -> requests.Session:
+    adapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=_get_retry()
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(_get_headers())
+    return session
+
+
+_session: Optional[requests.Session] = None
+
+
+def get_session() -> requests.Session:
+    """Return the process wide keep-alive session, creating it on first use."""
+    global _session
+    if _session is None:
+        _session = _create_session()
+    return _session
+
+
+def _post(path: str, payload: dict) -> dict:
+    response = get_session().post(
+        f"{LEMMA_API_URL}{path}", json=payload, timeout=TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def lemmatize_text(text: str, raise_errors: bool = False) -> List[str]:
     """
     Lemmatize text and return unique lemmas.
-    
+
     Uses the /api/text endpoint which handles tokenization and returns
     unique lemmas suitable for search indexing.
+
+    Unless `raise_errors` is set, errors are logged and no lemmas are returned. Callers
+    that store the lemmas should set it, an outage is not an empty document.
     """
     if not text or not text.strip():
         return []
-    
+
     try:
-        response = requests.post(
-            f"{LEMMA_API_URL}/api/text",
-            json={"text": text},
-            headers=_get_headers(),
-            timeout=TIMEOUT,
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("lemmas", [])
+        return _post("/api/text", {"text": text}).get("lemmas", [])
     except requests.RequestException as e:
         logger.error(f"Lemma API error: {e}")
+        if raise_errors:
+            raise
         return []
     except Exception as e:
         logger.error(f"Unexpected error calling lemma API: {e}")
+        if raise_errors:
+            raise
         return []
 
 
+def lemmatize_texts(
+    texts: Iterable[str], max_workers: int = MAX_WORKERS, raise_errors: bool = False
+) -> List[List[str]]:
+    """
+    Lemmatize many documents concurrently over the pooled session.
+
+    The API has no multi-document endpoint so documents are sent as parallel
+    keep-alive requests, at most `max_workers` in flight. Results are returned in the
+    same order as `texts`. With `raise_errors` the first failing document raises.
+    """
+    texts = list(texts)
+    lemmatize = partial(lemmatize_text, raise_errors=raise_errors)
+    if len(texts) <= 1 or max_workers <= 1:
+        return [lemmatize(text) for text in texts]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(texts))) as executor:
+        return list(executor.map(lemmatize, texts))
+
+
 def lemmatize_word(word: str) -> List[str]:
     """
     Lemmatize a single word and return its lemmas.
-    
+
     Uses the /api/lemmatize endpoint for single word lookups.
     """
     if not word or not word.strip():
         return []
-    
+
     try:
-        response = requests.post(
-            f"{LEMMA_API_URL}/api/lemmatize",
-            json={"word": word},
-            headers=_get_headers(),
-            timeout=TIMEOUT,
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("lemmas", [])
+        return _post("/api/lemmatize", {"word": word}).get("lemmas", [])
     except requests.RequestException as e:
         logger.error(f"Lemma API error for word '{word}': {e}")
         return [word]  # Fallback to original word
@@ -81,32 +148,57 @@ def lemmatize_word(word: str) -> List[str]:
         return [word]
 
 
-def lemmatize_batch(words: List[str]) -> List[dict]:
-    """
-    Lemmatize multiple words in a single request.
-    
-    Uses the /api/batch endpoint for efficient batch processing.
-    Returns list of {"word": str, "lemmas": List[str]} dicts.
-    """
-    if not words:
-        return []
-    
-    # API limit is 1000 words per batch
-    words = words[:1000]
-    
+def _lemmatize_chunk(words: List[str]) -> List[dict]:
+    return _post("/api/batch", {"words": words}).get("results", [])
+
+
+def _lemmatize_chunk_or_fallback(words: List[str]) -> List[dict]:
     try:
-        response = requests.post(
-            f"{LEMMA_API_URL}/api/batch",
-            json={"words": words},
-            headers=_get_headers(),
-            timeout=TIMEOUT,
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data.get("results", [])
+        return _lemmatize_chunk(words)
     except requests.RequestException as e:
         logger.error(f"Lemma API batch error: {e}")
         return [{"word": w, "lemmas": [w]} for w in words]
     except Exception as e:
         logger.error(f"Unexpected error calling lemma API: {e}")
         return [{"word": w, "lemmas": [w]} for w in words]
+
+
+def lemmatize_batch(
+    words: List[str], max_workers: int = MAX_WORKERS, raise_errors: bool = False
+) -> List[dict]:
+    """
+    Lemmatize multiple words with as few requests as possible.
+
+    Uses the /api/batch endpoint for efficient batch processing. Word lists longer
+    than the API limit are split into chunks which are sent concurrently.
+    Returns list of {"word": str, "lemmas": List[str]} dicts.
+
+    Unless `raise_errors` is set, a failing chunk falls back to each word being its own
+    lemma.
+    """
+    if not words:
+        return []
+
+    fetch = _lemmatize_chunk if raise_errors else _lemmatize_chunk_or_fallback
+    chunks = [words[i : i + BATCH_SIZE] for i in range(0, len(words), BATCH_SIZE)]
+    if len(chunks) == 1 or max_workers <= 1:
+        results = [fetch(chunk) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            results = list(executor.map(fetch, chunks))
+    return [result for chunk_results in results for result in chunk_results]
+
+
+def lemmatize_words(
+    words: Iterable[str], raise_errors: bool = False
+) -> Dict[str, List[str]]:
+    """
+    Lemmatize distinct words in batch and return a `word → lemmas` mapping.
+
+    Blank words are skipped and duplicates are only sent once.
+    """
+    unique = list(dict.fromkeys(w for w in words if w and w.strip()))
+    return {
+        result["word"]: result.get("lemmas", [])
+        for result in lemmatize_batch(unique, raise_errors=raise_errors)
+    }
@@ -0,0 +1,224 @@
+"""Two-tier cache of word → lemmas in front of the lemma HTTP API.
+
+1.  An in-process LRU with a bounded number of entries, shared by all threads.
+2.  The `lemma_cache` Postgres table, shared by all web and worker processes.
+
+Both tiers expire entries after `LEMMA_CACHE_TTL` days so that improvements to the
+lemma API eventually reach us. Only successful API responses are cached; when the API
+fails the caller gets the word itself as fallback lemma, just like `lemma_api`.
+
+Hit and miss counters are kept in `stats` for each tier.
+
+The tiers are implemented by `TwoTierCache`, which `wordforms.WordformCache` uses too.
+"""
+
+import datetime as dt
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from planitor import config
+from planitor.database import db_context
+from planitor.models import CachedLemma
+
+from . import lemma_api
+
+logger = logging.getLogger(__name__)
+
+LEMMA_CACHE_SIZE = config("LEMMA_CACHE_SIZE", cast=int, default=50_000)
+LEMMA_CACHE_TTL = config("LEMMA_CACHE_TTL", cast=int, default=90)  # days
+LEMMA_CACHE_PERSISTENT = config("LEMMA_CACHE_PERSISTENT", cast=bool, default=True)
+
+Lemmas = Dict[str, List[str]]
+Entries = Dict[str, List[str]]
+
+
+class LRUCache:
+    """Thread safe LRU mapping with a per entry time to live."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, words: Iterable[str]) -> Lemmas:
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for word in words:
+                item = self._data.get(word)
+                if item is None:
+                    continue
+                expires, lemmas = item
+                if expires < now:
+                    del self._data[word]
+                    continue
+                self._data.move_to_end(word)
+                found[word] = lemmas
+        return found
+
+    def set_many(self, lemmas: Lemmas) -> None:
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for word, _lemmas in lemmas.items():
+                self._data[word] = (expires, _lemmas)
+                self._data.move_to_end(word)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """`key → list of strings` kept in an in-process `LRUCache` in front of a table
+    shared by all processes, the `key_column` and `value_column` of `model`.
+
+    `get_many` returns what either tier knows, promoting table hits to memory, and
+    callers compute the rest and hand it to `set_many`, which stores it in both. With
+    a `ttl` entries expire in both tiers, which needs a `created` column on `model`.
+    A table that can not be reached behaves like an empty one."""
+
+    def __init__(
+        self,
+        model,
+        key_column: str,
+        value_column: str,
+        maxsize: int,
+        ttl: Optional[dt.timedelta] = None,
+        persistent: bool = True,
+    ):
+        self.model = model
+        self.key_column = key_column
+        self.value_column = value_column
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize, ttl.total_seconds() if ttl else float("inf"))
+        self.persistent = persistent
+        self.stats: Counter = Counter()
+
+    def _db_get_many(self, keys: List[str]) -> Entries:
+        if not self.persistent or not keys:
+            return {}
+        key = getattr(self.model, self.key_column)
+        try:
+            with db_context() as db:
+                rows = db.query(key, getattr(self.model, self.value_column)).filter(
+                    key.in_(keys)
+                )
+                if self.ttl is not None:
+                    rows = rows.filter(
+                        self.model.created > dt.datetime.utcnow() - self.ttl
+                    )
+                return {key: value for key, value in rows}
+        except SQLAlchemyError as e:
+            logger.error(f"{self.model.__tablename__} cache read error: {e}")
+            return {}
+
+    def store(self, db: Session, values: Entries) -> None:
+        """Upsert `values` into the table, without committing."""
+        stmt = insert(self.model).values(
+            [
+                {self.key_column: key, self.value_column: value}
+                for key, value in values.items()
+            ]
+        )
+        set_ = {self.value_column: getattr(stmt.excluded, self.value_column)}
+        if self.ttl is not None:
+            set_["created"] = dt.datetime.utcnow()
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[getattr(self.model, self.key_column)], set_=set_
+            )
+        )
+
+    def _db_set_many(self, values: Entries) -> None:
+        if not self.persistent or not values:
+            return
+        try:
+            with db_context() as db:
+                self.store(db, values)
+                db.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"{self.model.__tablename__} cache write error: {e}")
+
+    def get_many(self, keys: List[str]) -> Entries:
+        found = self.memory.get_many(keys)
+        self.stats["memory_hits"] += len(found)
+
+        from_db = self._db_get_many([k for k in keys if k not in found])
+        self.stats["db_hits"] += len(from_db)
+        self.memory.set_many(from_db)
+        found.update(from_db)
+        return found
+
+    def set_many(self, values: Entries) -> None:
+        self.memory.set_many(values)
+        self._db_set_many(values)
+
+    def clear(self) -> None:
+        """Clear the in-process tier and the counters. The table is left as is."""
+        self.memory.clear()
+        self.stats.clear()
+
+
+class LemmaCache(TwoTierCache):
+    def __init__(
+        self,
+        maxsize: int = LEMMA_CACHE_SIZE,
+        ttl_days: int = LEMMA_CACHE_TTL,
+        persistent: bool = LEMMA_CACHE_PERSISTENT,
+    ):
+        super().__init__(
+            CachedLemma,
+            "word",
+            "lemmas",
+            maxsize,
+            dt.timedelta(days=ttl_days),
+            persistent,
+        )
+
+    def lemmatize_words(self, words: Iterable[str]) -> Lemmas:
+        """Return `word → lemmas` for all non-blank words, asking the lemma API only
+        about words that neither cache tier knows."""
+        words = list(dict.fromkeys(w for w in words if w and w.strip()))
+        found = self.get_many(words)
+
+        missing = [w for w in words if w not in found]
+        self.stats["misses"] += len(missing)
+        if not missing:
+            return found
+
+        try:
+            from_api = lemma_api.lemmatize_words(missing, raise_errors=True)
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Lemma API batch error: {e}")
+            self.stats["errors"] += 1
+            found.update({w: [w] for w in missing})
+            return found
+
+        self.set_many(from_api)
+        found.update(from_api)
+        return found
+
+    def lemmatize_word(self, word: str) -> List[str]:
+        if not word or not word.strip():
+            return []
+        return self.lemmatize_words([word]).get(word, [word])
+
+
+lemma_cache = LemmaCache()
+
+lemmatize_word = lemma_cache.lemmatize_word
+lemmatize_words = lemma_cache.lemmatize_words
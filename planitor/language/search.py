@@ -21,7 +21,8 @@ from reynir.bindb import GreynirBin
 
 from planitor.utils.stopwords import stopwords
 
-from .lemma_api import lemmatize_text, lemmatize_word
+from .lemma_api import lemmatize_text
+from .lemma_cache import lemmatize_word, lemmatize_words
 
 
 def get_wordbase(word) -> Optional[str]:
@@ -52,7 +53,25 @@ def filter_stopwords(lemmas: Iterable[str]) -> Iterable[str]:
             yield lemma
 
 
-def get_lemmas(text: str, ignore: List[str] = None) -> Iterable[str]:
+def filter_lemmas(lemmas: Iterable[str], ignore: List[str] = None) -> Iterable[str]:
+    """
+    Turn lemmas from the lemma API into lemmas suitable for indexing by dropping
+    ignored terms and stopwords and expanding compound words.
+    """
+    if ignore is None:
+        ignore = []
+
+    # Filter out ignored terms and stopwords
+    filtered = (l for l in lemmas if l not in ignore)
+    filtered = filter_stopwords(filtered)
+
+    # Handle compound words
+    yield from with_wordbases(filtered)
+
+
+def get_lemmas(
+    text: str, ignore: List[str] = None, raise_errors: bool = False
+) -> Iterable[str]:
     """
     Get lemmas from text suitable for search indexing.
     
@@ -61,22 +80,12 @@ def get_lemmas(text: str, ignore: List[str] = None) -> Iterable[str]:
     Args:
         text: The text to lemmatize
         ignore: List of terms to ignore (currently not used with API)
+        raise_errors: Raise lemma API errors instead of yielding nothing
     
     Yields:
         Lemmas suitable for indexing
     """
-    if ignore is None:
-        ignore = []
-    
-    # Get lemmas from the API
-    lemmas = lemmatize_text(text)
-    
-    # Filter out ignored terms and stopwords
-    filtered = (l for l in lemmas if l not in ignore)
-    filtered = filter_stopwords(filtered)
-    
-    # Handle compound words
-    yield from with_wordbases(filtered)
+    yield from filter_lemmas(lemmatize_text(text, raise_errors), ignore)
 
 
 def get_wordforms(bindb: GreynirBin, term: str) -> Set[str]:
@@ -118,12 +127,17 @@ def lemmatize_query(search_query: str) -> str:
         terms = search_query.strip('"').split()
         return '"{}"'.format(" ".join(term.title() for term in terms))
 
+    # Lemmatize every term of the query in one batch request, unless cached
+    lemmas_by_word = lemmatize_words(re.findall(r"\w+", search_query))
+
     def repl(matchobj):
         query = matchobj.group(0)
         query_title = query.title()
         
         # Get lemmas for this term
-        lemmas = lemmatize_word(query)
+        lemmas = lemmas_by_word.get(query)
+        if lemmas is None:
+            lemmas = lemmatize_word(query)
         
         # Remove dashes from compound words and titlecase
         lemmas = [lemma.replace("-", "").title() for lemma in lemmas][:1]
@@ -0,0 +1,86 @@
+"""Cache of lexeme → inflected word forms, used to highlight search results.
+
+Looking up word forms in BÍN means opening `GreynirBin` and doing four case lookups
+per meaning of every search term. The results never change between requests, so
+they are kept in
+
+1.  an in-process LRU with a bounded number of entries, and
+2.  the `wordforms` table, which `precompute_wordforms` fills for every lexeme in the
+    search index.
+
+BÍN is only consulted for terms that neither tier knows, which are then stored in
+both. The tiers are a `lemma_cache.TwoTierCache` without expiry.
+"""
+
+from typing import Dict, Iterable, List, Set
+
+from reynir.bindb import GreynirBin
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from planitor import config
+from planitor.models import Wordforms
+
+from .lemma_cache import TwoTierCache
+from .search import get_wordforms
+
+WORDFORMS_CACHE_SIZE = config("WORDFORMS_CACHE_SIZE", cast=int, default=20_000)
+WORDFORMS_PERSISTENT = config("WORDFORMS_PERSISTENT", cast=bool, default=True)
+
+Forms = Dict[str, List[str]]
+
+
+def lookup_wordforms(terms: Iterable[str]) -> Forms:
+    """Look up terms in BÍN, opening the database once for all of them."""
+    terms = list(terms)
+    if not terms:
+        return {}
+    with GreynirBin.get_db() as bindb:
+        return {term: sorted(get_wordforms(bindb, term)) for term in terms}
+
+
+class WordformCache(TwoTierCache):
+    def __init__(
+        self,
+        maxsize: int = WORDFORMS_CACHE_SIZE,
+        persistent: bool = WORDFORMS_PERSISTENT,
+    ):
+        super().__init__(Wordforms, "lemma", "forms", maxsize, persistent=persistent)
+
+    def get_wordforms(self, terms: Iterable[str]) -> Forms:
+        """Return `term → forms` for every term, each form set including the term."""
+        terms = list(dict.fromkeys(terms))
+        found = self.get_many(terms)
+
+        missing = [t for t in terms if t not in found]
+        if missing:
+            from_bin = lookup_wordforms(missing)
+            self.set_many(from_bin)
+            found.update(from_bin)
+        return found
+
+    def get_highlight_terms(self, terms: Iterable[str]) -> Set[str]:
+        return {form for forms in self.get_wordforms(terms).values() for form in forms}
+
+
+wordform_cache = WordformCache()
+
+get_highlight_terms = wordform_cache.get_highlight_terms
+
+
+def precompute_wordforms(db: Session, batch_size: int = 1000) -> int:
+    """Store word forms for every lexeme in the minutes search index that is not in
+    the `wordforms` table yet. Returns the number of lexemes added."""
+    lexemes = [
+        word
+        for word, in db.execute(
+            text(
+                "SELECT s.word FROM ts_stat('SELECT search_vector FROM minutes') AS s "
+                "WHERE NOT EXISTS (SELECT 1 FROM wordforms w WHERE w.lemma = s.word)"
+            )
+        )
+    ]
+    for i in range(0, len(lexemes), batch_size):
+        wordform_cache.store(db, lookup_wordforms(lexemes[i : i + batch_size]))
+        db.commit()
+    return len(lexemes)
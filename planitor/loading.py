@@ -0,0 +1,55 @@
+"""Eager loading profiles for the meeting, case and minute pages.
+
+The templates of these pages walk from a minute to its meeting, council and
+municipality, to its case with the case entities and address, and to the responses
+and attachments of the minute. Loaded lazily that is a query per relationship, and
+for lists a query per row. Each profile loads what its page touches up front, with
+joins for many-to-one relationships and a `SELECT ... IN` for collections.
+
+>>> db.query(Minute).options(*minute_page()).get(minute_id)
+
+Profiles are functions because chained loader options share state and must not be
+reused between queries.
+"""
+
+from typing import Callable, List
+
+from sqlalchemy.orm import Load, joinedload, selectinload
+
+from planitor.models import Attachment, Case, CaseEntity, Council, Meeting, Minute
+
+
+def _case_details(case: Callable[[], Load]) -> List[Load]:
+    """What the header of case and minute pages shows about the case, relative to
+    the loader path made by `case`."""
+    return [
+        case().joinedload(Case.municipality),
+        case().joinedload(Case.iceaddr),
+        case().joinedload(Case.geoname),
+        case().joinedload(Case.housenumber),
+        case().selectinload(Case.entities).joinedload(CaseEntity.entity),
+    ]
+
+
+def meeting_page() -> List[Load]:
+    return [joinedload(Meeting.council).joinedload(Council.municipality)]
+
+
+def case_page() -> List[Load]:
+    return _case_details(lambda: Load(Case))
+
+
+def case_page_minutes() -> List[Load]:
+    """The minutes listed on a case page."""
+    return [joinedload(Minute.meeting).joinedload(Meeting.council)]
+
+
+def minute_page() -> List[Load]:
+    return [
+        joinedload(Minute.meeting)
+        .joinedload(Meeting.council)
+        .joinedload(Council.municipality),
+        selectinload(Minute.responses),
+        selectinload(Minute.attachments).joinedload(Attachment.pdf),
+        *_case_details(lambda: joinedload(Minute.case)),
+    ]
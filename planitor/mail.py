@@ -1,35 +1,134 @@
 import logging
-from typing import Optional
+import queue
+import smtplib
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, suppress
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set
 from pathlib import Path
 
 import emails
+from emails.backend import SMTPBackend
 from emails.template import JinjaTemplate
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
+from sentry_sdk import capture_exception
 
 from planitor import config
+from planitor.cache import MemoryBackend
 from planitor.templates import human_date, timeago
 
 password_reset_jwt_subject = "preset"
 
+MAIL_WORKERS = config("MAIL_WORKERS", cast=int, default=4)
+MAIL_RETRIES = config("MAIL_RETRIES", cast=int, default=3)
+MAIL_RETRY_BACKOFF = config("MAIL_RETRY_BACKOFF", cast=float, default=2.0)  # seconds
+MAIL_BATCH_SIZE = config("MAIL_BATCH_SIZE", cast=int, default=100)
+
+MAIL_TEMPLATE_CACHE_DIR = config("MAIL_TEMPLATE_CACHE_DIR", default=None)
+MAIL_FRAGMENT_CACHE_SIZE = config("MAIL_FRAGMENT_CACHE_SIZE", cast=int, default=2_000)
+MAIL_FRAGMENT_TTL = config("MAIL_FRAGMENT_TTL", cast=int, default=15 * 60)  # seconds
+
+# Compiled templates are kept on disk (in the system temp dir by default) so new
+# worker processes do not have to compile them again
 jinja_env = Environment(
-    loader=FileSystemLoader(Path(__file__).resolve().parent / "email-templates")
+    loader=FileSystemLoader(Path(__file__).resolve().parent / "email-templates"),
+    bytecode_cache=FileSystemBytecodeCache(MAIL_TEMPLATE_CACHE_DIR),
 )
 
-jinja_env.globals.update({"human_date": human_date, "timeago": timeago})
+# Rendered fragments that are the same in every email, such as the body of a minute,
+# by template and object id. Entries expire so that edits eventually show up.
+fragment_cache = MemoryBackend(MAIL_FRAGMENT_CACHE_SIZE)
+
+
+def render_fragment(template: str, key: Any, **context) -> Markup:
+    """Render `template` once per `key` and serve it from `fragment_cache` after that.
+    The context must only contain what `key` identifies, nothing recipient specific."""
+    cache_key = f"{template}:{key}"
+    html = fragment_cache.get(cache_key)
+    if html is None:
+        html = jinja_env.get_template(template).render(context)
+        fragment_cache.set(cache_key, html, MAIL_FRAGMENT_TTL)
+    return Markup(html)
+
+
+jinja_env.globals.update(
+    {"human_date": human_date, "timeago": timeago, "fragment": render_fragment}
+)
 
 
 def get_html(template, context):
     return jinja_env.get_template(template).render(context)
 
 
-def send_email(
+def get_smtp_options() -> Dict[str, Any]:
+    smtp_options = {"host": config("SMTP_HOST"), "port": config("SMTP_PORT", cast=int)}
+    smtp_options["tls"] = config("SMTP_TLS", cast=bool, default=True)
+    if config("SMTP_USER"):
+        smtp_options["user"] = config("SMTP_USER")
+    if config("SMTP_PASSWORD"):
+        smtp_options["password"] = config("SMTP_PASSWORD")
+    return smtp_options
+
+
+class SMTPPool:
+    """A bounded pool of SMTP backends that keep their connection open between
+    messages, so sending many emails does not mean a new connection and TLS handshake
+    for each one. A backend is used by one thread at a time."""
+
+    def __init__(self, size: int = MAIL_WORKERS, **smtp_options):
+        self.size = size
+        self.smtp_options = smtp_options
+        self._backends: "queue.LifoQueue[Optional[SMTPBackend]]" = queue.LifoQueue()
+        for _ in range(size):
+            self._backends.put(None)
+
+    @contextmanager
+    def connection(self) -> Iterator[SMTPBackend]:
+        backend = self._backends.get()
+        try:
+            if backend is None:
+                backend = SMTPBackend(
+                    fail_silently=False, **(self.smtp_options or get_smtp_options())
+                )
+            yield backend
+        except Exception:
+            # Start over with a fresh connection after any error
+            if backend is not None:
+                with suppress(Exception):
+                    backend.close()
+            raise
+        finally:
+            # Always give the slot back, empty if the backend could not be built
+            self._backends.put(backend)
+
+    def close(self) -> None:
+        for _ in range(self.size):
+            backend = self._backends.get()
+            if backend is not None:
+                backend.close()
+        for _ in range(self.size):
+            self._backends.put(None)
+
+
+smtp_pool = SMTPPool()
+
+
+class Email(NamedTuple):
+    message: emails.Message
+    email_to: str
+    context: dict
+
+
+def create_email(
     email_to: str,
     subject: str,
     html_template: str,
     context: dict,
     from_name: Optional[str] = None,
     from_email: Optional[str] = None,
-):
+) -> Email:
+    """Render an email, ready to be sent with `deliver`."""
     context = context.copy()
     message = emails.Message(
         subject=JinjaTemplate(subject),
@@ -40,13 +139,126 @@ def send_email(
         ),
         headers={"X-SES-CONFIGURATION-SET": "planitor-ses-configuration"},
     )
-    smtp_options = {"host": config("SMTP_HOST"), "port": config("SMTP_PORT", cast=int)}
-    smtp_options["tls"] = config("SMTP_TLS", cast=bool, default=True)
-    if config("SMTP_USER"):
-        smtp_options["user"] = config("SMTP_USER")
-    if config("SMTP_PASSWORD"):
-        smtp_options["password"] = config("SMTP_PASSWORD")
     message.transform()
-    response = message.send(to=email_to, render=context, smtp=smtp_options)
-    logging.info(f"send email result: {response}")
-    return response
+    return Email(message, email_to, context)
+
+
+def is_transient(error: Exception) -> bool:
+    """Dropped connections and 4xx replies are worth retrying, other errors such as
+    refused recipients are not."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # Other SMTP errors are OSErrors too, but only network errors are transient
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def is_refused_recipient(error: Exception) -> bool:
+    """The recipient can never be reached. Unlike errors about our own setup, such as
+    a wrong password or sender, sending it again will not help."""
+    return isinstance(error, smtplib.SMTPRecipientsRefused)
+
+
+def deliver(
+    email: Email,
+    pool: SMTPPool = smtp_pool,
+    retries: int = MAIL_RETRIES,
+    backoff: float = MAIL_RETRY_BACKOFF,
+):
+    """Send an email over a pooled connection, retrying transient failures with
+    exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            with pool.connection() as smtp:
+                response = email.message.send(
+                    to=email.email_to, render=email.context, smtp=smtp
+                )
+        except Exception as e:
+            if attempt == retries or not is_transient(e):
+                raise
+            logging.warning(f"send email to {email.email_to} failed, retrying: {e}")
+            time.sleep(backoff * 2**attempt)
+        else:
+            logging.info(f"send email result: {response}")
+            return response
+
+
+def send_email(
+    email_to: str,
+    subject: str,
+    html_template: str,
+    context: dict,
+    from_name: Optional[str] = None,
+    from_email: Optional[str] = None,
+):
+    return deliver(
+        create_email(email_to, subject, html_template, context, from_name, from_email)
+    )
+
+
+class MailDispatcher:
+    """Sends emails on a bounded pool of threads while the caller renders the next ones.
+
+    Each email is submitted with a `key` identifying what it is about. Once
+    `batch_size` emails have been sent `on_sent` is called with their `(key,
+    response)` pairs, so that the caller can record them in bulk. Failures are
+    reported to Sentry. Emails to refused recipients are passed to `on_sent` with the
+    error as their response so they are not tried again, while emails failing for any
+    other reason are left out to be sent another time. Callbacks run in the thread
+    that submits, never in the sending threads.
+
+    >>> with MailDispatcher(on_sent=mark_sent) as dispatcher:
+    ...     for user, deliveries in ...:
+    ...         dispatcher.submit(create_email(user.email, ...), deliveries)
+    """
+
+    def __init__(
+        self,
+        on_sent: Callable[[List[tuple]], None],
+        workers: int = MAIL_WORKERS,
+        batch_size: int = MAIL_BATCH_SIZE,
+        pool: SMTPPool = smtp_pool,
+    ):
+        self.on_sent = on_sent
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = pool
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pending: Dict[Future, Any] = {}
+        self._sent: List[tuple] = []
+
+    def submit(self, email: Email, key: Any) -> None:
+        # Keep a bounded number of emails in flight, which also bounds memory
+        while len(self._pending) >= self.workers * 2:
+            self._collect(wait(self._pending, return_when=FIRST_COMPLETED).done)
+        future = self._executor.submit(deliver, email, self.pool)
+        self._pending[future] = key
+
+    def _collect(self, done: Set[Future]) -> None:
+        for future in done:
+            key = self._pending.pop(future)
+            try:
+                self._sent.append((key, future.result()))
+            except Exception as e:
+                capture_exception(e)
+                if is_refused_recipient(e):
+                    self._sent.append((key, f"failed: {e!r}"))
+        if len(self._sent) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._sent:
+            sent, self._sent = self._sent, []
+            self.on_sent(sent)
+
+    def close(self) -> None:
+        self._collect(wait(self._pending).done)
+        self.flush()
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,204 @@
+"""Worker-local grid index of the addresses of recently updated cases.
+
+The map on the address page asks for cases near an address every time it is panned.
+Instead of running `DISTINCT ON (address_id)` over cases joined to addresses for each
+of those requests, every process keeps the most recent case of each address updated
+within `MAP_INDEX_DAYS` in memory, bucketed into a uniform grid of latitude/longitude
+cells. A radius query only measures the distance to addresses in the cells overlapping
+its bounding box.
+
+The index is brought up to date before it is queried, at most every
+`MAP_INDEX_REFRESH` seconds, by reloading only the addresses of cases that got new
+minutes since the last refresh. Every `MAP_INDEX_RELOAD` seconds it is rebuilt from
+scratch, which also drops cases that aged out or moved to another address.
+"""
+
+import datetime as dt
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from planitor import config
+from planitor.models import Address, Case, CaseStatusEnum, Minute
+
+MAP_INDEX_DAYS = 365
+MAP_INDEX_REFRESH = config("MAP_INDEX_REFRESH", cast=int, default=60)
+MAP_INDEX_RELOAD = config("MAP_INDEX_RELOAD", cast=int, default=60 * 60)
+
+CELL_SIZE = 0.01  # degrees, about 1.1 km of latitude and 0.5 km of longitude
+
+# The sphere earthdistance uses, so radiuses mean the same as in SQL
+EARTH_RADIUS = 6378168
+
+
+class CaseLocation(NamedTuple):
+    hnitnum: int
+    lat: float
+    lon: float
+    label: str
+    status: Optional[CaseStatusEnum]
+    updated: dt.datetime
+
+
+def get_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance in meters."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(min(1.0, math.sqrt(a)))
+
+
+def load_case_locations(
+    db: Session, since: dt.datetime, min_minute_id: Optional[int] = None
+) -> List[CaseLocation]:
+    """The most recent case of every address updated after `since`. With
+    `min_minute_id` only addresses of cases with newer minutes are loaded."""
+    query = (
+        db.query(Case.address_id, Case.status, Case.updated)
+        .distinct(Case.address_id)
+        .filter(Case.address_id != None, Case.updated > since)  # noqa
+        .order_by(Case.address_id, Case.updated.desc())
+    )
+    if min_minute_id is not None:
+        touched = (
+            db.query(Case.address_id)
+            .join(Minute, Minute.case_id == Case.id)
+            .filter(Minute.id > min_minute_id)
+        )
+        query = query.filter(Case.address_id.in_(touched.subquery()))
+    sq = query.subquery()
+
+    rows = (
+        db.query(Address, sq.c.status, sq.c.updated)
+        .join(sq, sq.c.address_id == Address.hnitnum)
+        .filter(Address.lat_wgs84 != None, Address.long_wgs84 != None)  # noqa
+    )
+    return [
+        CaseLocation(
+            address.hnitnum,
+            float(address.lat_wgs84),
+            float(address.long_wgs84),
+            str(address),
+            status,
+            updated,
+        )
+        for address, status, updated in rows
+    ]
+
+
+class CaseGrid:
+    def __init__(
+        self,
+        cell_size: float = CELL_SIZE,
+        days: int = MAP_INDEX_DAYS,
+        refresh_interval: float = MAP_INDEX_REFRESH,
+        reload_interval: float = MAP_INDEX_RELOAD,
+    ):
+        self.cell_size = cell_size
+        self.days = days
+        self.refresh_interval = refresh_interval
+        self.reload_interval = reload_interval
+        self.last_minute_id: Optional[int] = None
+        self.refreshed = self.reloaded = -math.inf
+        self._locations: Dict[int, CaseLocation] = {}
+        self._cells: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self._lock = threading.Lock()
+        # Held while deciding on and doing a refresh, so only one thread reloads
+        self._refresh_lock = threading.Lock()
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _add(self, location: CaseLocation) -> None:
+        previous = self._locations.get(location.hnitnum)
+        if previous is not None:
+            self._cells[self._cell(previous.lat, previous.lon)].discard(
+                previous.hnitnum
+            )
+        self._locations[location.hnitnum] = location
+        self._cells[self._cell(location.lat, location.lon)].add(location.hnitnum)
+
+    def refresh(self, db: Session, full: bool = False) -> int:
+        """Load locations changed since the last refresh, or all of them when `full`
+        or when the index is empty. Returns the number of locations loaded."""
+        # Read the high-water mark first so that minutes added while loading are
+        # picked up by the next refresh
+        last_minute_id = db.query(func.max(Minute.id)).scalar() or 0
+        since = dt.datetime.utcnow() - dt.timedelta(days=self.days)
+        full = full or self.last_minute_id is None
+        locations = load_case_locations(
+            db, since, None if full else self.last_minute_id
+        )
+        now = time.monotonic()
+        with self._lock:
+            if full:
+                self._locations.clear()
+                self._cells.clear()
+                self.reloaded = now
+            for location in locations:
+                self._add(location)
+            self.last_minute_id = last_minute_id
+            self.refreshed = now
+        return len(locations)
+
+    def is_stale(self, now: float) -> bool:
+        return (
+            now - self.reloaded > self.reload_interval
+            or now - self.refreshed > self.refresh_interval
+        )
+
+    def refresh_if_stale(self, db: Session) -> None:
+        """Refresh the index if it is due. Concurrent callers wait for the one thread
+        that refreshes and then find the index fresh, instead of each refreshing."""
+        if not self.is_stale(time.monotonic()):
+            return
+        with self._refresh_lock:
+            now = time.monotonic()
+            if now - self.reloaded > self.reload_interval:
+                self.refresh(db, full=True)
+            elif now - self.refreshed > self.refresh_interval:
+                self.refresh(db)
+
+    def query(
+        self,
+        lat: float,
+        lon: float,
+        radius: float,
+        since: dt.datetime,
+        limit: Optional[int] = None,
+    ) -> List[CaseLocation]:
+        """Locations within `radius` meters of `lat, lon` whose case was updated after
+        `since`, most recently updated first."""
+        lat, lon = float(lat), float(lon)
+        dlat = math.degrees(radius / EARTH_RADIUS)
+        dlon = dlat / max(math.cos(math.radians(min(abs(lat) + dlat, 90))), 1e-6)
+        low_lat, low_lon = self._cell(lat - dlat, lon - dlon)
+        high_lat, high_lon = self._cell(lat + dlat, lon + dlon)
+
+        found = []
+        with self._lock:
+            for i in range(low_lat, high_lat + 1):
+                for j in range(low_lon, high_lon + 1):
+                    for hnitnum in self._cells.get((i, j), ()):
+                        location = self._locations[hnitnum]
+                        if location.updated <= since:
+                            continue
+                        distance = get_distance(lat, lon, location.lat, location.lon)
+                        if distance < radius:
+                            found.append(location)
+
+        found.sort(key=lambda location: location.updated, reverse=True)
+        return found[:limit] if limit else found
+
+    def __len__(self):
+        return len(self._locations)
+
+
+case_grid = CaseGrid()
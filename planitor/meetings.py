@@ -1,7 +1,6 @@
 from sqlakeyset import get_page
-from sqlalchemy import func
 
-from .models import CaseStatusEnum, Council, Meeting, Minute
+from .models import CaseStatusEnum, Council, Meeting
 
 
 class MeetingWrap:
@@ -10,9 +9,9 @@ class MeetingWrap:
 
     """
 
-    def __init__(self, meeting, counts):
+    def __init__(self, meeting):
         self._meeting = meeting
-        self.counts = dict(zip((enum for enum in ENUMS), counts))
+        self.counts = {enum: meeting.status_counts.get(enum.name, 0) for enum in ENUMS}
         self.year = meeting.start.year
 
     def __getattribute__(self, key):
@@ -51,16 +50,17 @@ ENUMS = list(CaseStatusEnum) + [NoneEnum()]
 class MeetingView:
     """Wraps a meeting query that number of each type of minute. This is useful to
     display an stream of meetings in a card or table layout with useful metadata.
-    Queries are constructed by iterating through an enum, applying an outerjoin
-    subquery with a count for each enum value. The query results are wrapped in
-    instances of the `MeetingWrap` class for better accessing of the counter values.
+    The counts are read from the denormalized `Meeting.status_counts` column, kept up
+    to date by `crud.update_meeting_status_counts`, so a page of meetings is a single
+    keyset query. The query results are wrapped in instances of the `MeetingWrap`
+    class for better accessing of the counter values.
 
     What’s cool is that no enums are hardcoded.
 
     Usage:
 
-    >>> for meeting in MeetingView(db, offset=0, limit=100):
-    >>>     print(meeting.name, meeting.counter[CaseStatusEnum.delayed])
+    >>> for meeting in MeetingView(db, page_bookmark=None):
+    >>>     print(meeting.name, meeting.counts[CaseStatusEnum.delayed])
 
     This would give you a list of meetings along with number of minutes where the
     status was `delayed`.
@@ -73,30 +73,17 @@ class MeetingView:
         self.db = db
         self.page_bookmark = page_bookmark
 
-        def get_sq(enum):
-            return (
-                self.db.query(
-                    func.count(Minute.id).label("count"),
-                    Minute.meeting_id.label("meeting_id"),
-                )
-                .filter(Minute.status == (None if isinstance(enum, NoneEnum) else enum))
-                .group_by(Minute.meeting_id)
-            ).subquery(enum.name)
-
-        sqs = [(get_sq(enum), enum) for enum in ENUMS]
-
-        query = db.query(Meeting).select_from(Meeting).join(Council)
-        for sq, enum in sqs:
-            query = query.outerjoin(sq, sq.c.meeting_id == Meeting.id).add_columns(
-                func.coalesce(sq.c.count, 0).label(enum.name)
-            )
-        query = query.filter(*filters)
-        query = query.order_by(Meeting.start.desc())
+        query = (
+            db.query(Meeting)
+            .join(Council)
+            .filter(*filters)
+            .order_by(Meeting.start.desc())
+        )
 
         self.query = query
         self.page = get_page(query, per_page=self.PER_PAGE, page=page_bookmark)
         self.paging = self.page.paging
 
     def __iter__(self):
-        for meeting, *counts in self.page:
-            yield MeetingWrap(meeting, counts)
+        for meeting in self.page:
+            yield MeetingWrap(meeting)
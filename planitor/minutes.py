@@ -1,12 +1,20 @@
+import hashlib
+from functools import lru_cache
 from typing import List
 
 from planitor.models import Address, Minute
+from planitor.utils.stopwords import stopwords
 
 from .language import search
 
 IGNORE = ("dags.", "kr.", "nr.")
 REPLACE = (("Málinu vísað", "Málinu er vísað"),)
 
+# Bump when the lemma API or the way we derive lemmas changes in a way that should
+# reindex every minute. Changes to IGNORE, REPLACE and stopwords are picked up
+# automatically by `get_index_version`.
+INDEX_VERSION = 1
+
 
 def get_address_parts(address: Address) -> List[str]:
     parts = []
@@ -32,17 +40,51 @@ def get_minute_document(minute: Minute) -> str:
     return "\n".join(part.rstrip(". ") + "." for part in parts if part)
 
 
-def get_minute_lemmas(minute: Minute) -> List[str]:
-    _lemmas = []
+def get_minute_text(minute: Minute) -> str:
+    """The minute document as sent to the lemmatizer."""
     text = get_minute_document(minute)
     for replace in REPLACE:
         text = text.replace(*replace)
-    _lemmas += list(search.get_lemmas(text=text, ignore=IGNORE))
+    return text
+
+
+def get_minute_extra_terms(minute: Minute) -> List[str]:
+    """Terms indexed verbatim, next to the lemmas of the minute document."""
+    terms = []
     if minute.case.address:
-        _lemmas.append(minute.case.address)
+        terms.append(minute.case.address)
     if minute.case.iceaddr:
-        _lemmas.extend(sorted(get_address_parts(minute.case.iceaddr)))
+        terms.extend(sorted(get_address_parts(minute.case.iceaddr)))
     if minute.case.serial:
-        _lemmas.append(minute.case.serial)
-    _lemmas += [e.entity.name for e in (minute.case.entities or [])]
-    return _lemmas
+        terms.append(minute.case.serial)
+    terms += [e.entity.name for e in (minute.case.entities or [])]
+    return terms
+
+
+def get_minute_lemmas(minute: Minute) -> List[str]:
+    """Lemmas to index a minute by. Raises if the lemma API fails, rather than
+    returning just the extra terms."""
+    _lemmas = list(
+        search.get_lemmas(text=get_minute_text(minute), ignore=IGNORE, raise_errors=True)
+    )
+    return _lemmas + get_minute_extra_terms(minute)
+
+
+@lru_cache(maxsize=None)
+def get_index_version() -> str:
+    digest = hashlib.sha1()
+    for part in (str(INDEX_VERSION), *IGNORE, *map("→".join, REPLACE)):
+        digest.update(part.encode() + b"\0")
+    for word in sorted(stopwords):
+        digest.update(word.encode() + b"\0")
+    return digest.hexdigest()
+
+
+def get_minute_index_hash(minute: Minute) -> str:
+    """A fingerprint of everything that goes into the search vector of a minute. If
+    it matches `minute.index_hash` the minute does not need to be reindexed."""
+    digest = hashlib.sha1(get_index_version().encode())
+    digest.update(get_minute_text(minute).encode())
+    for term in get_minute_extra_terms(minute):
+        digest.update(b"\0" + term.encode())
+    return digest.hexdigest()
@@ -18,6 +18,7 @@ from .city import (  # noqa
     Response,
     Permit,
 )
+from .language import CachedLemma, Wordforms  # noqa
 from .monitor import Delivery, Subscription, SubscriptionTypeEnum  # noqa
 from .enums import (  # noqa
     CaseStatusEnum,
@@ -25,6 +26,7 @@ from .enums import (  # noqa
     EntityTypeEnum,
     BuildingTypeEnum,
     PermitTypeEnum,
+    SearchOrderEnum,
 )
 
 _all = locals().values()
@@ -12,6 +12,7 @@ from sqlalchemy import (
     UniqueConstraint,
     func,
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.types import ARRAY, BIGINT, NUMERIC, TEXT
 from sqlalchemy_utils import CompositeArray, CompositeType, TSVectorType
@@ -107,6 +108,16 @@ class Address(Base):
 
     municipality = relationship("Municipality")
 
+    __table_args__ = (
+        # Radius lookups filter on `earth_box(...) @> ll_to_earth(lat, lon)`, see
+        # `planitor.geo.within_radius`
+        Index(
+            "ix_addresses_earth",
+            func.ll_to_earth(lat_wgs84, long_wgs84),
+            postgresql_using="gist",
+        ),
+    )
+
     @property
     def address(self):
         if self.heiti_nf is None:
@@ -154,6 +165,15 @@ class Entity(Base):
 
     __table_args__ = (
         Index("ix_entity_search_vector_tsv", search_vector, postgresql_using="gin"),
+        # Company names mentioned in minutes are resolved by their lowercased name
+        Index("ix_entities_lower_name", func.lower(name)),
+        # Candidates for fuzzy company name lookups, requires the pg_trgm extension
+        Index(
+            "ix_entities_slug_trgm",
+            slug,
+            postgresql_using="gin",
+            postgresql_ops={"slug": "gin_trgm_ops"},
+        ),
     )
 
     def get_human_kennitala(self):
@@ -232,6 +252,12 @@ class Meeting(Base):
 
     minutes = relationship("Minute")
 
+    # Denormalized number of minutes by status name ("other" for no status), see
+    # `crud.update_meeting_status_counts`
+    status_counts = Column(JSONB, nullable=False, server_default="{}")
+
+    __table_args__ = (Index("ix_meetings_council_id_start", council_id, start),)
+
     def __str__(self):
         return f"{self.council.name} {self.name}"
 
@@ -296,6 +322,8 @@ class Case(Base):
     # This field is denormalized, is derived from most recent minute
     status = Column(Enum(CaseStatusEnum), nullable=True)
     updated = Column(DateTime, nullable=True)
+    # So is the number of minutes about the case, maintained by `create_minute`
+    minute_count = Column(Integer, nullable=False, default=0, server_default="0")
 
     geoname_osm_id = Column(BIGINT, ForeignKey(Geoname.osm_id))
     geoname = relationship(Geoname)
@@ -383,6 +411,7 @@ class Minute(Base):
     remarks = Column(String)
     lemmas = Column(String)
     search_vector = Column(TSVectorType(regconfig="pg_catalog.simple"))
+    index_hash = Column(String)  # See `minutes.get_minute_index_hash`
     subcategory = Column(String)
     participants = Column(String)
     entrants_and_leavers = Column(ARRAY(String))
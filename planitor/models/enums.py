@@ -108,6 +108,11 @@ class SubscriptionTypeEnum(Choices):
     search = "leit", "Leit"
 
 
+class SearchOrderEnum(Choices):
+    date = "nyjast", "Nýjast"
+    relevance = "vaegi", "Mikilvægast"
+
+
 class CouncilTypeEnum(Choices):
     byggingarfulltrui = "byggingarfulltrui", "Byggingarfulltrúi"
     skipulagsfulltrui = "skipulagsfulltrui", "Skipulagsfulltrúi"
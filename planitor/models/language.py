@@ -0,0 +1,33 @@
+from sqlalchemy import Column, DateTime, String, func
+from sqlalchemy.types import ARRAY
+
+from ..database import Base
+
+
+class CachedLemma(Base):
+    """Lemmas of a surface form as returned by the lemma API. Acts as the shared,
+    persistent tier of `planitor.language.lemma_cache` so that workers and web
+    processes do not ask the API about words we have already seen."""
+
+    __tablename__ = "lemma_cache"
+
+    word = Column(String, primary_key=True)
+    lemmas = Column(ARRAY(String), nullable=False)
+    created = Column(DateTime, server_default=func.now(), nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<CachedLemma word={self.word}>"
+
+
+class Wordforms(Base):
+    """Inflected forms of an indexed lexeme, as used to highlight search results.
+    Filled on demand and by `planitor.language.wordforms.precompute_wordforms` so that
+    the web process rarely has to look anything up in BÍN."""
+
+    __tablename__ = "wordforms"
+
+    lemma = Column(String, primary_key=True)
+    forms = Column(ARRAY(String), nullable=False)
+
+    def __repr__(self):
+        return f"<Wordforms lemma={self.lemma}>"
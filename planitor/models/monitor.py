@@ -5,19 +5,27 @@ from sqlalchemy import (
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
     String,
+    Text,
     UniqueConstraint,
     func,
 )
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
-from sqlalchemy.types import ARRAY
+from sqlalchemy.types import ARRAY, UserDefinedType
 
 from ..database import Base
 from .city import CouncilTypeEnum
 from .enums import SubscriptionTypeEnum
 
 
+class TSQuery(UserDefinedType):
+    def get_col_spec(self, **kw):
+        return "TSQUERY"
+
+
 class Subscription(Base):
 
     __tablename__ = "subscriptions"
@@ -34,6 +42,11 @@ class Subscription(Base):
 
     search_query = Column(String)
     search_lemmas = Column(String)
+    # Both are derived from `search_lemmas` by `crud.set_search_query`: the parsed
+    # query, and the lexemes a minute must share with it to possibly match (empty when
+    # the query has none, e.g. only negated terms).
+    search_tsquery = Column(TSQuery)
+    search_lexemes = Column(postgresql.ARRAY(Text))
 
     address_hnitnum = Column(Integer, ForeignKey("addresses.hnitnum"), nullable=True)
     address = relationship("Address")
@@ -50,6 +63,12 @@ class Subscription(Base):
 
     council_types = Column(ARRAY(Enum(CouncilTypeEnum)))
 
+    __table_args__ = (
+        Index(
+            "ix_subscriptions_search_lexemes", search_lexemes, postgresql_using="gin"
+        ),
+    )
+
     def get_string(self, case="nominative"):
         if self.type == SubscriptionTypeEnum.case:
             nl = "málsnúmeri {}".format(self.case.serial)
@@ -20,92 +20,195 @@ had picked up the note, so the user can tweak their monitoring.
 
 """
 
+from datetime import timedelta
 from itertools import groupby
-from typing import Iterable, Iterator, Tuple
+from typing import Any, Iterable, Iterator, List, Tuple
 
 import dramatiq
+from psycopg2.extras import execute_values
 from sentry_sdk import capture_exception
-from sqlalchemy import and_, func
-from sqlalchemy.orm import Session
+from sqlalchemy import func, union
+from sqlalchemy.orm import Query, Session, aliased, contains_eager
 
-from planitor import mail
-from planitor.crud import create_delivery, get_delivery
+from planitor import config, mail
+from planitor.crud import insert_deliveries
 from planitor.database import db_context
-from planitor.models import Address, Case, Delivery, Meeting, Minute, Subscription, User
+from planitor.geo import earth_point, within_radius
+from planitor.models import (
+    Address,
+    Case,
+    CaseEntity,
+    Council,
+    Delivery,
+    Meeting,
+    Minute,
+    Subscription,
+    User,
+)
 
 MinuteDeliveries = Iterable[Tuple[Minute, Iterable[Delivery]]]
 
+# Unsent deliveries fetched per round trip when building emails
+DIGEST_CHUNK_SIZE = config("DIGEST_CHUNK_SIZE", cast=int, default=500)
 
-def match_minute(db: Session, minute: Minute) -> Iterator[Subscription]:
+# How far back `send_meeting_emails` looks for meetings that were never matched, and
+# how old a meeting must be before it is considered stuck rather than in progress
+DELIVERY_CATCH_UP = timedelta(days=config("DELIVERY_CATCH_UP_DAYS", cast=int, default=8))
+DELIVERY_GRACE = timedelta(hours=config("DELIVERY_GRACE_HOURS", cast=int, default=1))
 
-    filters = (
-        Subscription.id == 0
-    )  # Start a false-y filter to use the or-pipe operator on
+MARK_SENT_SQL = """
+    UPDATE deliveries
+    SET sent = now(), mail_confirmation = v.mail_confirmation
+    FROM (VALUES %s) AS v (id, mail_confirmation)
+    WHERE deliveries.id = v.id
+"""
 
-    kennitalas = [e.entity_id for e in minute.case.entities]
 
-    assert minute.search_vector or minute.case or kennitalas
+def match_minutes(db: Session, *filters) -> Query:
+    """Match every minute passing `filters` against all active subscriptions with a
+    handful of set-based queries, one per kind of subscription, and return a query of
+    distinct `(subscription_id, minute_id)` pairs.
 
-    if minute.search_vector:
+    This makes matching a meeting cost about the same as matching a single minute,
+    instead of running one query per minute that evaluates every subscription."""
 
-        sq = db.query(Minute.search_vector).filter(Minute.id == minute.id).subquery()
+    def pairs():
+        return db.query(
+            Subscription.id.label("subscription_id"), Minute.id.label("minute_id")
+        ).select_from(Minute)
 
-        filters = filters | and_(
-            Subscription.search_lemmas != None,  # noqa
-            sq.c.search_vector.op("@@")(
-                func.websearch_to_tsquery("simple", Subscription.search_lemmas)
-            ),
-        )
+    CaseAddress = aliased(Address)
+    SubscriptionAddress = aliased(Address)
 
-    if minute.case:
-        filters = filters | (Subscription.case == minute.case)
+    by_case = pairs().join(Subscription, Subscription.case_id == Minute.case_id)
 
-        address = minute.case.iceaddr
+    by_address = (
+        pairs()
+        .join(Case, Case.id == Minute.case_id)
+        .join(Subscription, Subscription.address_hnitnum == Case.address_id)
+    )
 
-        if address:
-            filters = filters | (Subscription.address == minute.case.iceaddr)
+    by_radius = (
+        pairs()
+        .join(Case, Case.id == Minute.case_id)
+        .join(CaseAddress, CaseAddress.hnitnum == Case.address_id)
+        .join(Subscription, Subscription.radius != None)  # noqa
+        .join(
+            SubscriptionAddress,
+            SubscriptionAddress.hnitnum == Subscription.address_hnitnum,
+        )
+        .filter(
+            within_radius(
+                earth_point(
+                    SubscriptionAddress.lat_wgs84, SubscriptionAddress.long_wgs84
+                ),
+                earth_point(CaseAddress.lat_wgs84, CaseAddress.long_wgs84),
+                Subscription.radius,
+            )
+        )
+    )
+
+    by_entity = (
+        pairs()
+        .join(CaseEntity, CaseEntity.case_id == Minute.case_id)
+        .join(Subscription, Subscription.entity_kennitala == CaseEntity.entity_id)
+    )
+
+    # Search subscriptions are matched the other way around, each minute is checked
+    # against the stored queries. The GIN index on `search_lexemes` narrows those down
+    # to the ones sharing a lexeme with the minute before any query is evaluated.
+    by_search = (
+        pairs()
+        .join(
+            Subscription,
+            Subscription.search_lexemes.overlap(
+                func.tsvector_to_array(Minute.search_vector)
+            ),
+        )
+        .filter(Minute.search_vector.op("@@")(Subscription.search_tsquery))
+    )
 
-            lat, lon = address.lat_wgs84, address.long_wgs84
-            if lat and lon:
-                filters = filters | (
-                    (
-                        func.earth_distance(
-                            func.ll_to_earth(lat, lon),
-                            func.ll_to_earth(Address.lat_wgs84, Address.long_wgs84),
-                        )
-                        < Subscription.radius
-                    )
+    # Queries without any required lexemes, and ones not compiled yet, are few enough
+    # to be evaluated for every minute.
+    by_unindexed_search = (
+        pairs()
+        .join(
+            Subscription,
+            (Subscription.search_lemmas != None)  # noqa
+            & (func.coalesce(func.cardinality(Subscription.search_lexemes), 0) == 0),
+        )
+        .filter(
+            Minute.search_vector.op("@@")(
+                func.coalesce(
+                    Subscription.search_tsquery,
+                    func.websearch_to_tsquery("simple", Subscription.search_lemmas),
                 )
+            )
+        )
+    )
 
-    if kennitalas:
-        filters = filters | (Subscription.entity_kennitala.in_(kennitalas))
+    matches = union(
+        *(
+            query.filter(*filters).statement
+            for query in (
+                by_case,
+                by_address,
+                by_radius,
+                by_entity,
+                by_search,
+                by_unindexed_search,
+            )
+        )
+    ).alias("matches")
 
-    query = (
-        db.query(Subscription)
-        .select_from(Subscription)
-        .outerjoin(Case)
-        .outerjoin(Address, Address.hnitnum == Subscription.address_hnitnum)
+    return (
+        db.query(matches.c.subscription_id, matches.c.minute_id)
+        .join(Subscription, Subscription.id == matches.c.subscription_id)
+        .join(Minute, Minute.id == matches.c.minute_id)
+        .join(Meeting, Meeting.id == Minute.meeting_id)
+        .join(Council, Council.id == Meeting.council_id)
         .filter(Subscription.active == True)  # noqa
         # No `subscription_councils` means it should match all of them, the UI masks
         # this by rendering checked checkboxes for all options - when one is unchecked
         # the other rows will appear.
         .filter(
-            (Subscription.council_types == None)
-            | Subscription.council_types.any(minute.meeting.council.council_type.name)
+            (Subscription.council_types == None)  # noqa
+            | Subscription.council_types.any(Council.council_type)
         )
-        .filter(filters)
     )
 
-    yield from query
+
+def match_meeting(db: Session, meeting_id: int) -> Query:
+    return match_minutes(db, Minute.meeting_id == meeting_id)
+
+
+def match_minute(db: Session, minute: Minute) -> Iterator[Subscription]:
+    subscription_ids = match_minutes(db, Minute.id == minute.id).with_entities(
+        Subscription.id
+    )
+    yield from db.query(Subscription).filter(Subscription.id.in_(subscription_ids))
 
 
-def get_unsent_query(db: Session, immediate: bool):
+def get_unsent_query(db: Session, immediate: bool) -> Query:
+    """Unsent deliveries ordered by user, meeting and minute, with everything the
+    email templates touch loaded in the same query."""
     return (
         db.query(Delivery)
         .join(Subscription)
         .join(Minute, Delivery.minute_id == Minute.id)
         .join(Meeting, Minute.meeting_id == Meeting.id)
         .join(Case, Minute.case_id == Case.id)
+        .options(
+            contains_eager(Delivery.subscription).joinedload(Subscription.user),
+            contains_eager(Delivery.subscription).joinedload(Subscription.case),
+            contains_eager(Delivery.subscription).joinedload(Subscription.address),
+            contains_eager(Delivery.subscription).joinedload(Subscription.entity),
+            contains_eager(Delivery.minute).contains_eager(Minute.case),
+            contains_eager(Delivery.minute)
+            .contains_eager(Minute.meeting)
+            .joinedload(Meeting.council)
+            .joinedload(Council.municipality),
+        )
         .filter(
             Delivery.sent == None,  # noqa
             Subscription.active == True,
@@ -116,39 +219,88 @@ def get_unsent_query(db: Session, immediate: bool):
 
 
 def get_unsent_deliveries(
-    db, immediate: bool
+    db, immediate: bool, chunk_size: int = DIGEST_CHUNK_SIZE
 ) -> Iterable[Tuple[User, Iterable[Delivery]]]:
+    """Stream unsent deliveries grouped by user. Rows are fetched from a server side
+    cursor `chunk_size` at a time so only about one user's deliveries are held in
+    memory at once.
+
+    The cursor lives as long as the transaction of `db`, so it must not be committed
+    while iterating, use `mark_sent` instead."""
     return groupby(
-        get_unsent_query(db, immediate=immediate),
+        get_unsent_query(db, immediate=immediate).yield_per(chunk_size),
         key=lambda delivery: delivery.subscription.user,
     )
 
 
-def _create_deliveries(db: Session, minute: Minute) -> Iterable[Delivery]:
-    for subscription in match_minute(db, minute):
-        """This result-set could be [sub{u=1}, sub{u=1}, sub{u=2}]. The user probably does
-        not want multiple emails for the same minute because multiple subscribers
-        matched it. Therefore we create deliveries but only deliver the first one."""
-        if get_delivery(db, subscription, minute):
-            """Cannot recreate this subscription/minute combo because of unique constraint
-            - but this state should not be reached unless a worker fails and is retrying
-            """
-            continue
-        delivery = create_delivery(db, subscription, minute)
-        yield delivery
+def mark_sent(sent: Iterable[Tuple[List[int], Any]]) -> None:
+    """Mark deliveries as sent with the SMTP response of their email, or the error it
+    permanently failed with, given as `(delivery_ids, response)` pairs. This happens
+    in a transaction of its own to leave the session that streams the deliveries
+    alone."""
+    rows = [
+        (delivery_id, str(response))
+        for delivery_ids, response in sent
+        for delivery_id in delivery_ids
+    ]
+    if not rows:
+        return
+    with db_context() as db:
+        cursor = db.connection().connection.cursor()
+        execute_values(cursor, MARK_SENT_SQL, rows, page_size=len(rows))
+        db.commit()
+
+
+def _create_meeting_deliveries(db: Session, meeting_id: int) -> List[int]:
+    """Create deliveries for all matches of a meeting at once.
+
+    The matches of a minute could be [sub{u=1}, sub{u=1}, sub{u=2}]. The user probably
+    does not want multiple emails for the same minute because multiple subscriptions
+    matched it. Therefore we create deliveries for all of them but emails group them
+    by user."""
+    delivery_ids = insert_deliveries(db, match_meeting(db, meeting_id))
+    db.commit()
+    return delivery_ids
+
+
+def get_undelivered_meetings(db: Session) -> Query:
+    """Ids of meetings scraped within `DELIVERY_CATCH_UP` that have no deliveries.
+    Meetings younger than `DELIVERY_GRACE` are left alone as their minutes may still
+    be being indexed."""
+    delivered = (
+        db.query(Minute.meeting_id)
+        .join(Delivery, Delivery.minute_id == Minute.id)
+        .filter(Minute.meeting_id != None)  # noqa
+    )
+    return db.query(Meeting.id).filter(
+        Meeting.created >= func.now() - DELIVERY_CATCH_UP,
+        Meeting.created < func.now() - DELIVERY_GRACE,
+        ~Meeting.id.in_(delivered),
+    )
+
+
+def _create_missing_deliveries(db: Session) -> List[int]:
+    """Match meetings whose `create_meeting_deliveries` callback never ran, e.g.
+    because a minute in their pipeline kept failing. Matching is idempotent, so a
+    meeting without any matches is just matched again next time."""
+    delivery_ids = insert_deliveries(
+        db, match_minutes(db, Minute.meeting_id.in_(get_undelivered_meetings(db)))
+    )
+    db.commit()
+    return delivery_ids
 
 
 @dramatiq.actor
-def create_deliveries(minute_id: int):
+def create_meeting_deliveries(meeting_id: int):
+    """Runs once all minutes of a newly scraped meeting have been processed and
+    indexed, then hands over to `send_meeting_emails`."""
     with db_context() as db:
         try:
-            minute = db.query(Minute).get(minute_id)
-            assert minute
-            for delivery in _create_deliveries(db, minute):
-                db.commit()
+            _create_meeting_deliveries(db, meeting_id)
         except Exception as e:
             capture_exception(e)
             raise
+    send_meeting_emails.send()
 
 
 def iter_user_meeting_deliveries(
@@ -164,8 +316,10 @@ def iter_user_meeting_deliveries(
             ]
 
 
-def send_meeting_email(user: User, meeting: Meeting, minute_deliveries: MinuteDeliveries):
-    return mail.send_email(
+def create_meeting_email(
+    user: User, meeting: Meeting, minute_deliveries: MinuteDeliveries
+) -> mail.Email:
+    return mail.create_email(
         user.email,
         str(meeting),
         "subscription_meeting.html",
@@ -174,34 +328,39 @@ def send_meeting_email(user: User, meeting: Meeting, minute_deliveries: MinuteDe
 
 
 def _send_meeting_emails(db: Session):
-    for user, meeting, minute_deliveries in iter_user_meeting_deliveries(db):
-        try:
-            smtp_response = send_meeting_email(user, meeting, minute_deliveries)
-        except Exception as e:
-            capture_exception(e)
-            continue
-        for _, deliveries in minute_deliveries:
-            for delivery in deliveries:
-                delivery.sent = func.now()
-                delivery.mail_confirmation = str(smtp_response)
-                db.add(delivery)
-        db.commit()
+    with mail.MailDispatcher(on_sent=mark_sent) as dispatcher:
+        for user, meeting, minute_deliveries in iter_user_meeting_deliveries(db):
+            delivery_ids = [
+                delivery.id
+                for _, deliveries in minute_deliveries
+                for delivery in deliveries
+            ]
+            try:
+                email = create_meeting_email(user, meeting, minute_deliveries)
+            except Exception as e:
+                capture_exception(e)
+                continue
+            dispatcher.submit(email, delivery_ids)
 
 
 @dramatiq.actor
 def send_meeting_emails():
-    """As you can see in `scrape.pipelines` both `update_minute_search_vector`
-    and `create_deliveries` for each minute are strung into one big pipeline,
-    then appended with this task in order to only send one email to each user
-    for all their subscriptions per meeting."""
+    """As you can see in `postprocess.process_minutes` the tasks of each minute,
+    `update_minute_search_vector` among them, are strung into one pipeline per minute,
+    then `create_meeting_deliveries` matches the whole meeting and appends this task
+    in order to only send one email to each user for all their subscriptions per
+    meeting.
+
+    Meetings that never reached that callback are matched here first."""
     with db_context() as db:
+        _create_missing_deliveries(db)
         _send_meeting_emails(db)
 
 
-def send_weekly_email(
+def create_weekly_email(
     user: User, meeting_minute_deliveries: Iterable[Tuple[Meeting, MinuteDeliveries]]
-):
-    return mail.send_email(
+) -> mail.Email:
+    return mail.create_email(
         user.email,
         "Vikuleg samantekt",
         "subscription_weekly.html",
@@ -226,22 +385,24 @@ def iter_user_weekly_deliveries(
 
 
 def _send_weekly_emails(db: Session):
-    for user, meeting_minute_deliveries in iter_user_weekly_deliveries(db):
-        try:
-            smtp_response = send_weekly_email(user, meeting_minute_deliveries)
-        except Exception as e:
-            capture_exception(e)
-            continue
-        for _, minute_deliveries in meeting_minute_deliveries:
-            for _, deliveries in minute_deliveries:
-                for delivery in deliveries:
-                    delivery.sent = func.now()
-                    delivery.mail_confirmation = str(smtp_response)
-                    db.add(delivery)
-        db.commit()
+    with mail.MailDispatcher(on_sent=mark_sent) as dispatcher:
+        for user, meeting_minute_deliveries in iter_user_weekly_deliveries(db):
+            delivery_ids = [
+                delivery.id
+                for _, minute_deliveries in meeting_minute_deliveries
+                for _, deliveries in minute_deliveries
+                for delivery in deliveries
+            ]
+            try:
+                email = create_weekly_email(user, meeting_minute_deliveries)
+            except Exception as e:
+                capture_exception(e)
+                continue
+            dispatcher.submit(email, delivery_ids)
 
 
 @dramatiq.actor
 def send_weekly_emails():
     with db_context() as db:
+        _create_missing_deliveries(db)
         _send_weekly_emails(db)
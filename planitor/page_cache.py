@@ -0,0 +1,158 @@
+"""Cache of rendered public HTML pages.
+
+Meeting, case, minute, address and company pages rarely change once a meeting has
+been scraped, so their HTML is kept in `planitor.cache.cache`. Pages are cached by
+URL and by what in them depends on the visitor: the user shown in the page header
+and whether they follow what the page is about.
+
+Every page is tagged with the objects it shows, such as `("case", 1)`. Each tag has a
+generation counter that is part of the cache key and `invalidate_pages` bumps it, so
+pages rendered before are no longer reachable. `postprocess.process_minutes`
+invalidates the meeting, cases, addresses and entities it touches.
+
+The cache key doubles as the ETag, which also includes the deployed version. A
+browser revalidating a page it already has gets a 304 without the page being read
+from the cache, let alone rendered. `get_etag` and
+`etag_matches` do the same for JSON API responses.
+
+>>> page = PageCache(request, [("case", case.id)], user, [bool(subscription)])
+>>> response = page.get()
+>>> if response is None:
+...     response = page.set(templates.TemplateResponse(...))
+"""
+
+import hashlib
+import json
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, Response
+
+from planitor import config
+from planitor.cache import cache
+from planitor.models import Case, CaseEntity, Minute, User
+
+PAGE_CACHE_TTL = config("PAGE_CACHE_TTL", cast=int, default=60 * 60)
+
+# Part of every ETag so that pages rendered by a previous deploy, with other templates
+# or code, are not revalidated. Without a commit each process start counts as a deploy.
+PAGE_VERSION = config("RENDER_GIT_COMMIT", default=None) or str(time.time())
+
+Tag = Tuple[str, Any]
+
+# Pages listing recent cases nearby depend on every new minute
+NEW_MINUTES: Tag = ("minutes", "new")
+
+
+def get_etag(*parts: Any) -> str:
+    """A strong ETag for a response that is fully determined by `parts`."""
+    key = json.dumps(parts, default=str)
+    return '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    etags = [value.strip() for value in if_none_match.split(",")]
+    return "*" in etags or etag in etags or f"W/{etag}" in etags
+
+
+def get_tag_group(tag: Tag) -> str:
+    kind, id = tag
+    return f"page:{kind}:{id}"
+
+
+def invalidate_pages(*tags: Tag) -> None:
+    for tag in set(tags):
+        if tag[1] is not None:
+            cache.bump_generation(get_tag_group(tag))
+
+
+def get_meeting_page_tags(db: Session, meeting_id: int) -> List[Tag]:
+    """Tags of the pages showing a meeting, its cases, their addresses or entities."""
+    tags = [("meeting", meeting_id), NEW_MINUTES]
+    cases = (
+        db.query(Case.id, Case.address_id)
+        .join(Minute, Minute.case_id == Case.id)
+        .filter(Minute.meeting_id == meeting_id)
+    )
+    for case_id, address_id in cases:
+        tags += [("case", case_id), ("address", address_id)]
+    entities = (
+        db.query(CaseEntity.entity_id)
+        .join(Minute, Minute.case_id == CaseEntity.case_id)
+        .filter(Minute.meeting_id == meeting_id)
+    )
+    tags += [("entity", kennitala) for kennitala, in entities]
+    return tags
+
+
+class PageCache:
+    def __init__(
+        self,
+        request: Request,
+        tags: Iterable[Tag],
+        user: Optional[User] = None,
+        vary: Iterable[Any] = (),
+    ):
+        self.request = request
+        groups = [get_tag_group(tag) for tag in tags if tag[1] is not None]
+        generations = cache.get_generations(groups)
+        # Without generations an old page can not be told apart from a fresh one, so
+        # pages are neither validated nor cached while the cache is down
+        self.enabled = generations is not None
+        self.etag = get_etag(
+            PAGE_VERSION,
+            request.url.path,
+            request.url.query,
+            user.to_dict() if user else None,
+            list(vary),
+            list(zip(groups, generations or [])),
+        )
+        self.key = "page:{}".format(self.etag.strip('"'))
+
+    def get_headers(self, last_modified: Optional[str]) -> dict:
+        # Pages can show the user, so only browsers may keep them, and revalidate
+        headers = {"ETag": self.etag, "Cache-Control": "private, no-cache"}
+        if last_modified:
+            headers["Last-Modified"] = last_modified
+        return headers
+
+    def is_not_modified(self, last_modified: Optional[str]) -> bool:
+        if "if-none-match" in self.request.headers:
+            return etag_matches(self.request, self.etag)
+        if_modified_since = self.request.headers.get("if-modified-since")
+        if if_modified_since and last_modified:
+            try:
+                modified = parsedate_to_datetime(last_modified)
+                return modified <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def get(self) -> Optional[Response]:
+        """A 304 or the cached page, or None when the page has to be rendered."""
+        if not self.enabled:
+            return None
+        if self.is_not_modified(None):
+            return Response(status_code=304, headers=self.get_headers(None))
+        cached = cache.get(self.key)
+        if cached is None:
+            return None
+        headers = self.get_headers(cached["last_modified"])
+        if self.is_not_modified(cached["last_modified"]):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(cached["body"], headers=headers)
+
+    def set(self, response: Response) -> Response:
+        """Cache a rendered page, adding the validators to its headers."""
+        if self.enabled and response.status_code == 200:
+            last_modified = formatdate(usegmt=True)
+            cached = {"body": response.body.decode(), "last_modified": last_modified}
+            cache.set(self.key, cached, PAGE_CACHE_TTL)
+            response.headers.update(self.get_headers(last_modified))
+        return response
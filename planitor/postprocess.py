@@ -10,41 +10,24 @@ from . import dramatiq, greynir
 from .attachments import update_pdf_attachment
 from .crud import (
     create_minute,
+    create_case_entities,
     get_or_create_attachment,
     get_or_create_case_entity,
     get_or_create_entity,
-    lookup_icelandic_company_in_entities,
+    lookup_icelandic_companies_in_entities,
+    update_meeting_status_counts,
 )
 from .database import db_context
 from .language.companies import extract_company_names
-from .minutes import get_minute_lemmas
+from .minutes import get_minute_index_hash, get_minute_lemmas
 from .models import Meeting, Minute, Response
-from .monitor import create_deliveries, send_meeting_emails
+from .monitor import create_meeting_deliveries
 from .notifications import send_applicant_notifications
+from .page_cache import get_meeting_page_tags, invalidate_pages
+from .search import invalidate_search_cache
 from .utils.kennitala import Kennitala
 
 
-def _get_entity(db: Session, name: str):
-    _all = list(lookup_icelandic_company_in_entities(db, name))
-    if len(_all) > 1:
-        # If there is a name collision we don’t know which one to pick
-        return None
-    if len(_all) == 1:
-        return _all[0]
-    # Try doing a lookup in the RSK.is fyrirtækjaskrá
-    # RSK now applies a ReCAPTCHA so we will try again later:
-
-    """
-    kennitala = get_kennitala_from_rsk_search(name)
-    if kennitala is not None:
-        kennitala = Kennitala(kennitala)
-        entity, created = get_or_create_entity(db, kennitala, name, address=None)
-        if created:
-            db.commit()
-        return entity
-    """
-
-
 def update_minute_with_entity_relations(
     db: Session, minute: Minute, entity_items: list
 ):
@@ -70,37 +53,48 @@ def update_minute_with_entity_relations(
     db.commit()
 
 
-def _update_minute_with_entity_mentions(db, minute):
-
-    if minute.inquiry is None:
-        return
+def _update_minutes_with_entity_mentions(db: Session, minutes: Iterable[Minute]):
+    """Resolve the company names mentioned in the inquiries of `minutes`, say all
+    minutes of a meeting, with one lookup and link the matches to their cases."""
 
-    mentions = extract_company_names(minute.inquiry)
+    mentions_by_minute = {
+        minute: extract_company_names(minute.inquiry)
+        for minute in minutes
+        if minute.inquiry is not None
+    }
 
-    if not mentions:
-        minute.assign_entity_mentions({})
+    # Names without a matching local entity are dropped. Looking them up in the RSK.is
+    # fyrirtækjaskrá would be next but RSK now applies a ReCAPTCHA, so we will try
+    # again later.
+    entities = lookup_icelandic_companies_in_entities(
+        db, {name for mentions in mentions_by_minute.values() for name in mentions}
+    )
+
+    tags = []
+    for minute, mentions in mentions_by_minute.items():
+        # We only want to persist mentions that have matching local entities
+        _matched_mentions = {}
+        _entities = {}
+        for co_name, locations in mentions.items():
+            entity = entities.get(co_name)
+            if entity is None:
+                continue
+            _matched_mentions[entity.kennitala] = locations
+            _entities[entity.kennitala] = entity
+        create_case_entities(db, minute.case, _entities.values(), applicant=False)
+        minute.assign_entity_mentions(_matched_mentions)
         db.add(minute)
-        db.commit()
-        return
+        tags += [("meeting", minute.meeting_id), ("case", minute.case_id)]
+        tags += [("entity", kennitala) for kennitala in _entities]
 
-    # We only want to persist mentions that have matching local entities, this is to
-    # track those
-    _matched_mentions = {}
+    db.commit()
 
-    for co_name, locations in mentions.items():
-        entity = _get_entity(db, co_name)
-        if entity is None:
-            continue
-        case_entity, created = get_or_create_case_entity(
-            db, minute.case, entity, applicant=False
-        )
-        if created:
-            db.commit()
-        _matched_mentions[entity.kennitala] = locations
+    # Mentions link to the entities, which now list the case
+    invalidate_pages(*tags)
 
-    minute.assign_entity_mentions(_matched_mentions)
-    db.add(minute)
-    db.commit()
+
+def _update_minute_with_entity_mentions(db: Session, minute: Minute):
+    _update_minutes_with_entity_mentions(db, [minute])
 
 
 @dramatiq.actor
@@ -162,6 +156,7 @@ def _update_minute_search_vector(minute: Minute, db: Session):
     print("MINUTE", minute.id, lemmas)
     minute.search_vector = func.to_tsvector("simple", " ".join(lemmas))
     minute.lemmas = ", ".join(lemmas)
+    minute.index_hash = get_minute_index_hash(minute)
     db.add(minute)
 
 
@@ -171,12 +166,16 @@ def update_minute_search_vector(minute_id: int, force: bool = False):
         minute = db.query(Minute).get(minute_id)
         if minute is None:
             return
-        if not minute.search_vector or force:
+        if force or minute.index_hash != get_minute_index_hash(minute):
             try:
                 _update_minute_search_vector(minute, db)
             except Exception as e:
+                # Leave the index hash alone so the minute is indexed again later
                 capture_exception(e)
+                db.rollback()
+                return
             db.commit()
+            invalidate_search_cache()
 
 
 def update_minute_with_attachments(
@@ -219,8 +218,6 @@ def process_minute(db: Session, item: dict, meeting: Meeting):
         update_minute_search_vector.message_with_options(
             args=(minute.id,), pipe_ignore=True
         ),
-        # ... run matches
-        create_deliveries.message_with_options(args=(minute.id,), pipe_ignore=True),
         send_applicant_notifications.message_with_options(
             args=(minute.id,), pipe_ignore=True
         ),
@@ -245,6 +242,13 @@ def process_minutes(db: Session, items: Iterable[dict], meeting: Meeting) -> Non
     if not pipes:
         return
 
+    update_meeting_status_counts(db, [meeting.id])
+    invalidate_pages(*get_meeting_page_tags(db, meeting.id))
+
+    # New minutes match address searches right away, the rest once they are indexed
+    invalidate_search_cache()
+
     g = group(pipes)
-    g.add_completion_callback(send_meeting_emails.message())
+    # Match the whole meeting against subscriptions once every minute is indexed
+    g.add_completion_callback(create_meeting_deliveries.message(meeting.id))
     g.run()
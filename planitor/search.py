@@ -1,15 +1,67 @@
-import math
+import asyncio
+import datetime as dt
+import functools
+import hashlib
+import json
 import re
-from typing import Generator, Set
+from typing import FrozenSet, Generator, List, NamedTuple, Optional, Set, Tuple, Union
 
+import anyio
 from iceaddr import iceaddr_suggest
 from markupsafe import Markup
-from reynir.bindb import GreynirBin
-from sqlalchemy import func, or_
+from sqlalchemy import Float, Text, case, cast, extract, func, or_
+from sqlakeyset import get_page
 from sqlalchemy.orm import Session, contains_eager, joinedload
 
-from planitor.language.search import get_wordforms, lemmatize_query
-from planitor.models import Case, CaseEntity, Council, Meeting, Minute
+from planitor import config
+from planitor.cache import cache
+from planitor.language.search import lemmatize_query
+from planitor.language.wordforms import get_highlight_terms
+from planitor.models import (
+    Case,
+    CaseEntity,
+    Council,
+    Meeting,
+    Minute,
+    SearchOrderEnum,
+)
+
+# Blocking calls made while serving search requests (lemma API, iceaddr sqlite, BÍN
+# and the database) run in a thread pool of this size, off the event loop
+SEARCH_THREADS = config("SEARCH_THREADS", cast=int, default=8)
+
+# Relevance ranking only scores this many of the most recent matches, so its cost
+# does not grow with the number of matches for common terms. The trade-off is that an
+# older match outside of them is never ranked, however relevant, see
+# `MinuteResults.get_rank_candidates`
+RANK_CANDIDATES = config("SEARCH_RANK_CANDIDATES", cast=int, default=1000)
+RANK_EPOCH = dt.datetime(2000, 1, 1)
+RANK_HALF_LIFE = config("SEARCH_RANK_HALF_LIFE", cast=int, default=730)  # days
+RANK_ADDRESS_BOOST = config("SEARCH_RANK_ADDRESS_BOOST", cast=float, default=1.0)
+
+# Counting stops at this many matches, broad queries show "1000+" results
+COUNT_LIMIT = config("SEARCH_COUNT_LIMIT", cast=int, default=1000)
+
+# Pages of results and counts are cached per normalized tsquery until new minutes are
+# indexed, see `invalidate_search_cache`, or this many seconds pass
+CACHE_TTL = config("SEARCH_CACHE_TTL", cast=int, default=600)
+
+_limiter: Optional[anyio.CapacityLimiter] = None
+
+
+def get_limiter() -> anyio.CapacityLimiter:
+    # Created lazily because anyio needs a running event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(SEARCH_THREADS)
+    return _limiter
+
+
+async def run_blocking(func, *args):
+    """Run a blocking function in the bounded search thread pool."""
+    return await anyio.to_thread.run_sync(
+        functools.partial(func, *args), limiter=get_limiter()
+    )
 
 
 def get_tsquery(search_query):
@@ -19,6 +71,15 @@ def get_tsquery(search_query):
     return func.websearch_to_tsquery("simple", lemmatize_query(search_query))
 
 
+def invalidate_search_cache() -> None:
+    cache.bump_generation("search")
+
+
+def get_address_hnitnums(search_query: str) -> List[int]:
+    # Only take first three suggestions
+    return [address["hnitnum"] for address in iceaddr_suggest(search_query)[:3]]
+
+
 def get_terms_from_query(tsquerytree: str):
     """querytree in Postgres takes a tsquery and strips negated terms and stopwords.
     This returns the terms considered, stripped of the boolean logic tokens."""
@@ -34,8 +95,74 @@ def get_terms_from_query(tsquerytree: str):
 HIGHLIGHT_RANGE = 30
 
 
+def _trie_pattern(trie: dict) -> str:
+    """Turn a character trie into a regex that shares prefixes, so the regex engine
+    never has to try more than one branch per character of input."""
+    branches = [re.escape(char) + _trie_pattern(trie[char]) for char in trie if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in trie:
+        return branches[0]
+    pattern = f"(?:{'|'.join(branches)})"
+    return f"{pattern}?" if "" in trie else pattern
+
+
+class HighlightMatcher:
+    """All highlight terms of a query compiled into a single case insensitive regex.
+    Build it once per query with `get_highlight_matcher` and reuse it for every result
+    on the page; finding the terms in a document is then one pass of the C regex
+    engine instead of tokenizing and looking up every word in Python."""
+
+    def __init__(self, highlight_terms: Set[str]):
+        trie: dict = {}
+        for term in highlight_terms:
+            if not term:
+                continue
+            node = trie
+            for char in term.lower():
+                node = node.setdefault(char, {})
+            node[""] = True
+        self.regex = (
+            re.compile(rf"(?<!\w){_trie_pattern(trie)}(?!\w)", re.IGNORECASE)
+            if trie
+            else None
+        )
+
+    def iter_spans(self, document: str, max_spans: int = 0):
+        """Yield `[start, end]` spans of matched terms, merging terms that are less
+        than `HIGHLIGHT_RANGE` apart into the same span."""
+        if self.regex is None:
+            return
+        span = None
+        count = 0
+        for match in self.regex.finditer(document):
+            start, end = match.span()
+            if span is not None and span[1] + HIGHLIGHT_RANGE >= start:
+                span[1] = end
+                continue
+            if span is not None:
+                yield span
+            count += 1
+            if max_spans and count > max_spans:
+                return
+            span = [start, end]
+        if span is not None:
+            yield span
+
+
+@functools.lru_cache(maxsize=64)
+def _get_highlight_matcher(highlight_terms: FrozenSet[str]) -> HighlightMatcher:
+    return HighlightMatcher(highlight_terms)
+
+
+def get_highlight_matcher(highlight_terms: Set[str]) -> HighlightMatcher:
+    return _get_highlight_matcher(frozenset(highlight_terms))
+
+
 def iter_preview_fragments(
-    document: str, highlight_terms: Set[str], max_fragments: int = 3
+    document: str,
+    highlight_terms: Union[Set[str], HighlightMatcher],
+    max_fragments: int = 3,
 ) -> Generator[Markup, None, None]:
     """Find segments within a document where instances of terms appear. Used to display
     segments of meeting minutes in search results (like google does where matched search
@@ -43,31 +170,12 @@ def iter_preview_fragments(
     Also add ellipses.
     """
 
-    spans = []
-
-    for match in re.finditer(r"\w+", document):
-        term = match.group()
-        if term.lower() not in highlight_terms:
-            continue
-
-        start, end = match.span()
-
-        # Make sure to expand the span if we have consecutively highlighted terms,
-        # otherwise we will yield multiple previews for each term
-        for span in spans:
-            prev_start, prev_end = span
+    if isinstance(highlight_terms, HighlightMatcher):
+        matcher = highlight_terms
+    else:
+        matcher = get_highlight_matcher(highlight_terms)
 
-            # See if highlight segments overlap
-            if prev_end + HIGHLIGHT_RANGE >= start:
-                # If so, lengthen the span to include this term
-                span.pop(1)
-                span.append(end)
-                break
-        else:
-            spans.append([start, end])
-
-    if max_fragments:
-        spans = spans[:max_fragments]
+    spans = list(matcher.iter_spans(document, max_fragments))
 
     if not spans:
         # No search terms to highlight, create three zero-length highlights so that the
@@ -116,40 +224,18 @@ def iter_preview_fragments(
         ).strip()
 
 
-class Pagination:
+def get_minute_document(minute: Minute) -> str:
+    """The text of a minute that search result previews are taken from."""
+    parts = [minute.inquiry, minute.remarks]
+    parts += [f"\n{ec.entity.name}" for ec in (minute.case.entities or [])]
+    return "\n".join(part for part in parts if part)
 
-    PER_PAGE = 15
-    NAV_SEGMENT_SIZE = 6
-
-    def __init__(self, query, count_query, number: int):
-        self.count = count_query.scalar()
-        self.number = number if number > 0 else 1
-        self.total_pages = int(math.ceil(self.count / self.PER_PAGE))
-        self.pages = list(
-            range(1, self.total_pages + 1)
-        )  # 1-based indexing of all pages
-        self.query = query.offset(self.PER_PAGE * (number - 1)).limit(self.PER_PAGE)
-
-    def get_page_segments(self):
-        """Always show first three pages and last three pages.
-        This is to render something like this: 1, 2, 3 ... 65 _66_ 67 ... 111, 112, 113
-        """
-        head = self.pages[0 : min(self.NAV_SEGMENT_SIZE, len(self.pages))]
-        tail = self.pages[-(min(self.NAV_SEGMENT_SIZE + 1, len(self.pages))) : -1]
-        range_page = self.pages[
-            max(0, self.number - self.NAV_SEGMENT_SIZE) : min(
-                len(self.pages), self.number + self.NAV_SEGMENT_SIZE + 1
-            )
-        ]
-        head = [p for p in head if p not in range_page]
-        tail = [p for p in tail if p not in range_page]
-        return head, range_page, tail
 
-    @property
-    def has_next(self):
-        if self.count == 0:
-            return False
-        return self.number != self.pages[-1]
+class CachedPaging(NamedTuple):
+    has_next: bool
+    has_previous: bool
+    bookmark_next: Optional[str]
+    bookmark_previous: Optional[str]
 
 
 class MinuteResults:
@@ -160,78 +246,213 @@ class MinuteResults:
     However when results are displayed people like to see highlighted segments where
     the search terms appear.
 
-    Pagination is handled by this class.
+    Pagination is handled by this class, with keyset pagination so that deep pages
+    are as fast as the first one.
 
     This class handles pagination and rendering HTML previews with the search terms
     highlighted.
     """
 
-    def __init__(self, db: Session, search_query: str, page: int):
+    PER_PAGE = 15
+
+    def __init__(
+        self,
+        db: Session,
+        search_query: str,
+        page_bookmark: Optional[str],
+        lemmatized_query: str = None,
+        hnitnums: List[int] = None,
+        order: SearchOrderEnum = SearchOrderEnum.date,
+    ):
         self.db = db
         self.search_query = search_query
-        self.query, count = self.get_query_and_count()
-        self.page = Pagination(self.query, count, page or 0)
+        self.order = order
+        if lemmatized_query is None:
+            lemmatized_query = lemmatize_query(search_query)
+        self.lemmatized_query = lemmatized_query
+        if hnitnums is None:
+            hnitnums = get_address_hnitnums(search_query)
+        self.hnitnums = hnitnums
+        self.page_bookmark = page_bookmark
+        self.query, self.count_query = self.get_query_and_count()
+        self.tsquery_text, self.tsquery_tree = self.get_normalized_tsquery()
+        self.load()
+
+    @classmethod
+    async def create(
+        cls,
+        db: Session,
+        search_query: str,
+        page_bookmark: Optional[str],
+        order: SearchOrderEnum = SearchOrderEnum.date,
+    ) -> "MinuteResults":
+        """Build the results without blocking the event loop. The lemma API and
+        iceaddr lookups run concurrently, then the database queries and BÍN lookups
+        for highlighting run in the search thread pool, one after the other since they
+        share the session."""
+        lemmatized_query, hnitnums = await asyncio.gather(
+            run_blocking(lemmatize_query, search_query),
+            run_blocking(get_address_hnitnums, search_query),
+        )
+        return await run_blocking(
+            cls, db, search_query, page_bookmark, lemmatized_query, hnitnums, order
+        )
 
-    def get_query_and_count(self):
-        tsquery = get_tsquery(self.search_query)
+    def get_cache_key(self, *parts) -> str:
+        key = json.dumps(
+            [self.tsquery_text, sorted(self.hnitnums), str(self.order), *parts]
+        )
+        return cache.versioned_key("search", hashlib.sha1(key.encode()).hexdigest())
+
+    def load(self) -> None:
+        """Load the page of minutes, the count and the highlight terms up front so
+        that iterating the results during template rendering does no I/O. Everything
+        but the minutes themselves is cached, a cached page only costs a primary key
+        lookup of its minutes."""
+        key = self.get_cache_key("page", self.page_bookmark)
+        cached = cache.get(key)
+        if cached is None:
+            try:
+                page = get_page(
+                    self.query, per_page=self.PER_PAGE, page=self.page_bookmark
+                )
+            except ValueError:  # Invalid or old style numbered page
+                page = get_page(self.query, per_page=self.PER_PAGE)
+            self.minutes = list(page)
+            cached = {
+                "ids": [minute.id for minute in self.minutes],
+                "count": self.get_count(),
+                "paging": [
+                    page.paging.has_next,
+                    page.paging.has_previous,
+                    page.paging.bookmark_next,
+                    page.paging.bookmark_previous,
+                ],
+                "highlight_terms": sorted(self.get_highlight_terms()),
+            }
+            cache.set(key, cached, CACHE_TTL)
+        else:
+            self.minutes = self.get_minutes(cached["ids"])
 
-        # Only take first three suggestions
-        hnitnums = [
-            address["hnitnum"] for address in iceaddr_suggest(self.search_query)[:3]
-        ]
+        self.count = min(cached["count"], COUNT_LIMIT)
+        self.count_capped = cached["count"] > COUNT_LIMIT
+        self.paging = CachedPaging(*cached["paging"])
+        self.highlight_terms = set(cached["highlight_terms"])
+        self.highlight_matcher = get_highlight_matcher(self.highlight_terms)
+
+    def get_tsquery(self):
+        return func.websearch_to_tsquery("simple", self.lemmatized_query)
+
+    def get_normalized_tsquery(self) -> Tuple[str, str]:
+        """Return the tsquery as parsed by Postgres, which identifies the query in the
+        cache no matter how it was spelled, and its querytree."""
+        tsquery = self.get_tsquery()
+        return self.db.query(cast(tsquery, Text), func.querytree(tsquery)).one()
+
+    def get_base_query(self):
+        return (
+            self.db.query(Minute)
+            .join(Minute.case)
+            .join(Minute.meeting)
+            .join(Meeting.council)
+            .join(Council.municipality)
+            .options(
+                contains_eager(Minute.meeting)
+                .contains_eager(Meeting.council)
+                .contains_eager(Council.municipality),
+                contains_eager(Minute.case),
+                joinedload(Minute.case, innerjoin=True)
+                .joinedload(Case.entities, innerjoin=False)
+                .joinedload(CaseEntity.entity, innerjoin=True),
+            )
+        )
+
+    def get_minutes(self, ids: List[int]) -> List[Minute]:
+        minutes = {
+            minute.id: minute
+            for minute in self.get_base_query().filter(Minute.id.in_(ids))
+        }
+        return [minutes[id] for id in ids if id in minutes]
+
+    def get_query_and_count(self):
+        tsquery = self.get_tsquery()
+        hnitnums = self.hnitnums
 
         filter_ = Minute.search_vector.op("@@")(tsquery)
         if hnitnums:
             filter_ = or_(filter_, Case.address_id.in_(hnitnums))
-        order_bys = [Meeting.start.desc()]
 
+        query = self.get_base_query()
+
+        if self.order == SearchOrderEnum.relevance:
+            candidates = self.get_rank_candidates(filter_)
+            query = query.join(candidates, candidates.c.id == Minute.id)
+            matches = self.db.query(candidates.c.id)
+            order_bys = [self.get_rank_score(tsquery).desc(), Meeting.start.desc()]
+        else:
+            query = query.filter(filter_)
+            matches = self.db.query(Minute.id).join(Case).filter(filter_)
+            order_bys = [Meeting.start.desc()]
+
+        count = self.db.query(func.count()).select_from(
+            matches.limit(COUNT_LIMIT + 1).subquery()
+        )
+
+        # Minute.id makes the order unique, which keyset pagination requires
+        return query.order_by(*order_bys, Minute.id.desc()), count
+
+    def get_count(self) -> int:
+        """Return the number of matches, counting at most `COUNT_LIMIT` + 1. The count
+        is shared by all pages of the query."""
+        key = self.get_cache_key("count")
+        count = cache.get(key)
+        if count is None:
+            count = self.count_query.scalar()
+            cache.set(key, count, CACHE_TTL)
+        return count
+
+    def get_address_boost(self):
+        return case([(Case.address_id.in_(self.hnitnums), RANK_ADDRESS_BOOST)], else_=0)
+
+    def get_rank_candidates(self, filter_):
+        """The `RANK_CANDIDATES` most recent matches, by id straight from the indexes.
+        Any rank, `ts_rank` included, would have to read and score the search vector of
+        every match before the limit applies, which is what this avoids. Since
+        `get_rank_score` favours recent minutes anyway, the ones left out are old
+        matches of common terms, which a more specific query still finds."""
         return (
-            (
-                self.db.query(Minute)
-                .join(Minute.case)
-                .join(Minute.meeting)
-                .join(Meeting.council)
-                .join(Council.municipality)
-                .options(
-                    contains_eager(Minute.meeting)
-                    .contains_eager(Meeting.council)
-                    .contains_eager(Council.municipality),
-                    contains_eager(Minute.case),
-                    joinedload(Minute.case, innerjoin=True)
-                    .joinedload(Case.entities, innerjoin=False)
-                    .joinedload(CaseEntity.entity, innerjoin=True),
-                )
-                .filter(filter_)
-                .order_by(
-                    *order_bys
-                )  # Relavance ranking is `func.ts_rank(tsvector, tsquery)`
-            ),
-            (self.db.query(func.count(Minute.id)).join(Case).filter(filter_)),
+            self.db.query(Minute.id)
+            .join(Case)
+            .filter(filter_)
+            .order_by(Minute.id.desc())
+            .limit(RANK_CANDIDATES)
+            .subquery()
         )
 
+    def get_rank_score(self, tsquery):
+        """Cover density rank, normalized to 0…1, plus a boost for minutes about a
+        matched address. The sum halves for every `RANK_HALF_LIFE` days since the
+        meeting so that recent minutes win over equally relevant old ones.
+
+        Decay is computed as growth since a fixed `RANK_EPOCH` rather than from now.
+        The order is the same but scores do not change between requests, which would
+        break the keyset bookmarks."""
+        score = func.coalesce(func.ts_rank_cd(Minute.search_vector, tsquery, 32), 0)
+        if self.hnitnums:
+            score = score + self.get_address_boost()
+        days = cast(extract("epoch", Meeting.start - RANK_EPOCH), Float) / 86400
+        recency = func.power(2, days / RANK_HALF_LIFE)
+        return score * func.coalesce(recency, 0)
+
     def get_highlight_terms(self) -> Set[str]:
         """Return the query and ask Postgres what terms were indexed in the query,
         which will be used for highlighting. We ask the Postgres querytree because it
         cleans up a lot of things, removes negated terms, lowercases and more."""
 
-        index_terms = get_terms_from_query(
-            self.db.query(func.querytree(get_tsquery(self.search_query))).scalar()
-        )
-        highlight_terms = set()
-        with GreynirBin.get_db() as bindb:
-            for term in index_terms:
-                highlight_terms.update(get_wordforms(bindb, term))
-        return highlight_terms
-
-    def get_document(self, minute: Minute) -> str:
-        parts = [minute.inquiry, minute.remarks]
-        parts += [f"\n{ec.entity.name}" for ec in (minute.case.entities or [])]
-        return "\n".join(part for part in parts if part)
+        return get_highlight_terms(get_terms_from_query(self.tsquery_tree))
 
     def __iter__(self):
-        highlight_terms = self.get_highlight_terms()
-        minutes = self.page.query.all()
-        for minute in minutes:
-            document = self.get_document(minute)
-            previews = iter_preview_fragments(document, highlight_terms)
+        for minute in self.minutes:
+            document = get_minute_document(minute)
+            previews = iter_preview_fragments(document, self.highlight_matcher)
             yield minute, previews
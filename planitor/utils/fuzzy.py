@@ -0,0 +1,130 @@
+"""In-memory fuzzy string matching that mirrors the pg_trgm + Levenshtein lookups done
+in the database.
+
+Trigrams are extracted the way pg_trgm does it: the string is lowercased and split
+into words on non-alphanumeric characters, each word is padded with two spaces in
+front and one behind, and every three character window is a trigram. Similarity is
+the number of shared trigrams over the number of distinct trigrams in both strings.
+
+`TrigramIndex` keeps an inverted index from trigram to keys so a lookup only looks at
+keys sharing at least one trigram with the query, keeps those at least `threshold`
+similar and ranks them by Levenshtein distance. It is meant for tests and offline
+scripts that match many names against a table that fits in memory.
+
+>>> index = TrigramIndex([("veitur-ohf", "5012131870")])
+>>> index.lookup("veitum-ohf")
+[('5012131870', 1)]
+"""
+
+import re
+from collections import Counter, defaultdict
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+# Same as the default of the `pg_trgm.similarity_threshold` setting
+SIMILARITY_THRESHOLD = 0.3
+
+
+def trigrams(string: str) -> FrozenSet[str]:
+    words = re.split(r"[^\w]+|_", string.lower())
+    return frozenset(
+        padded[i : i + 3]
+        for padded in ("  {} ".format(word) for word in words if word)
+        for i in range(len(padded) - 2)
+    )
+
+
+def similarity(a: str, b: str) -> float:
+    a_trigrams, b_trigrams = trigrams(a), trigrams(b)
+    if not a_trigrams and not b_trigrams:
+        return 0.0
+    shared = len(a_trigrams & b_trigrams)
+    return shared / (len(a_trigrams) + len(b_trigrams) - shared)
+
+
+def levenshtein(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """Edit distance between `a` and `b`. Like `levenshtein_less_equal` any distance
+    over `max_distance` is reported as `max_distance + 1`."""
+    if len(a) < len(b):
+        a, b = b, a
+    limit = max_distance + 1 if max_distance is not None else None
+    if limit is not None and len(a) - len(b) >= limit:
+        return limit
+    previous = list(range(len(b) + 1))
+    for i, a_char in enumerate(a, 1):
+        current = [i]
+        for j, b_char in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (a_char != b_char),
+                )
+            )
+        if limit is not None and min(current) >= limit:
+            return limit
+        previous = current
+    distance = previous[-1]
+    return distance if limit is None else min(distance, limit)
+
+
+class TrigramIndex:
+    """Maps string keys to values, looked up by similar keys. Several values can share
+    a key."""
+
+    def __init__(self, items: Iterable[Tuple[str, Any]] = ()):
+        self._values: DefaultDict[str, List[Any]] = defaultdict(list)
+        self._trigrams: Dict[str, FrozenSet[str]] = {}
+        self._postings: DefaultDict[str, Set[str]] = defaultdict(set)
+        for key, value in items:
+            self.add(key, value)
+
+    def add(self, key: str, value: Any) -> None:
+        if key not in self._trigrams:
+            self._trigrams[key] = key_trigrams = trigrams(key)
+            for trigram in key_trigrams:
+                self._postings[trigram].add(key)
+        self._values[key].append(value)
+
+    def candidates(
+        self, query: str, threshold: float = SIMILARITY_THRESHOLD
+    ) -> List[str]:
+        """Keys at least `threshold` similar to `query`, like `key % query`."""
+        query_trigrams = trigrams(query)
+        shared = Counter(
+            key for trigram in query_trigrams for key in self._postings.get(trigram, ())
+        )
+        return [
+            key
+            for key, count in shared.items()
+            if count / (len(query_trigrams) + len(self._trigrams[key]) - count)
+            >= threshold
+        ]
+
+    def lookup(
+        self,
+        query: str,
+        max_distance: int = 5,
+        threshold: float = SIMILARITY_THRESHOLD,
+    ) -> List[Tuple[Any, int]]:
+        """`(value, distance)` for candidates within `max_distance` edits of `query`,
+        closest first."""
+        found = []
+        for key in self.candidates(query, threshold):
+            distance = levenshtein(key, query, max_distance)
+            if distance <= max_distance:
+                found.extend((value, distance) for value in self._values[key])
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def __len__(self):
+        return len(self._trigrams)
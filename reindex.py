@@ -1,43 +1,64 @@
+from pathlib import Path
+
 import typer
 
-from planitor.postprocess import (
-    update_minute_search_vector,
-    _update_minute_search_vector,
-)
 from planitor.database import db_context
-from planitor.models import Meeting, Minute
+from planitor.indexing import (
+    BATCH_SIZE,
+    Checkpoint,
+    iter_minute_id_batches,
+    reindex_minutes,
+)
+from planitor.language.lemma_api import MAX_WORKERS
+from planitor.postprocess import update_minute_search_vector
 
 
-def main(last: int = 0, force: bool = False, worker: bool = False):
-    """Reindex minutes from latest to oldest."""
+def main(
+    last: int = 0,
+    force: bool = False,
+    worker: bool = False,
+    batch_size: int = BATCH_SIZE,
+    workers: int = MAX_WORKERS,
+    checkpoint: Path = Path(".reindex-checkpoint.json"),
+    resume: bool = True,
+):
+    """Reindex minutes from latest to oldest. Only minutes whose document or index
+    version changed since they were last indexed are lemmatized, unless --force.
+    Resumes from --checkpoint only if it was written with the same --force."""
 
     with db_context() as db:
-        query = db.query(Minute).join(Meeting)
-
-        if not force:
-            query = query.filter(Minute.lemmas == None)  # noqa
-
-        query = query.order_by(Meeting.start.desc())
-
-        if last > 0:
-            query = query.limit(last)
-
-        for minute in query:
-            try:
-                if worker:
-                    lemmas = []
-                    update_minute_search_vector.send(minute.id)
-                else:
-                    _update_minute_search_vector(minute, db=db)
-                    lemmas = minute.lemmas
-            except KeyboardInterrupt:
-                print("^C")
-                break
-            print(
-                "Indexing Minute:{} → {}".format(
-                    minute.id, ", ".join(list(lemmas)[:10])
-                )
+        if worker:
+            sent = 0
+            for ids in iter_minute_id_batches(db, batch_size):
+                for id in ids[: last - sent if last > 0 else None]:
+                    update_minute_search_vector.send(id, force=force)
+                    sent += 1
+                if last > 0 and sent >= last:
+                    break
+            print(f"Queued {sent} minutes")
+            return
+
+        _checkpoint = Checkpoint(checkpoint)
+        if not resume:
+            _checkpoint.clear()
+
+        def on_batch(ids, progress):
+            print(f"Indexed Minute:{ids[0]}…{ids[-1]} → {progress}")
+
+        try:
+            progress = reindex_minutes(
+                db,
+                force=force,
+                limit=last,
+                batch_size=batch_size,
+                max_workers=workers,
+                checkpoint=_checkpoint,
+                on_batch=on_batch,
             )
+        except KeyboardInterrupt:
+            print(f"^C, resume from {_checkpoint.path}")
+            return
+        print(f"Done: {progress}")
 
 
 if __name__ == "__main__":
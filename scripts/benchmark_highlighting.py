@@ -0,0 +1,87 @@
+"""Micro-benchmark of search result highlighting over real minute documents.
+
+Compares `iter_preview_fragments` with a precompiled `HighlightMatcher` against the
+previous implementation, which tokenized every document with `\\w+` and looked up
+each lowercased word in the set of highlight terms.
+
+    python -m scripts.benchmark_highlighting --terms hús,bílskúr,svalir
+"""
+
+import re
+import timeit
+from typing import List, Set
+
+import typer
+
+from planitor.database import db_context
+from planitor.language.wordforms import get_highlight_terms
+from planitor.models import Minute
+from planitor.search import (
+    HIGHLIGHT_RANGE,
+    get_highlight_matcher,
+    get_minute_document,
+    iter_preview_fragments,
+)
+
+
+def legacy_spans(document: str, highlight_terms: Set[str], max_fragments: int = 3):
+    spans = []
+    for match in re.finditer(r"\w+", document):
+        if match.group().lower() not in highlight_terms:
+            continue
+        start, end = match.span()
+        for span in spans:
+            if span[1] + HIGHLIGHT_RANGE >= start:
+                span[1] = end
+                break
+        else:
+            spans.append([start, end])
+    return spans[:max_fragments]
+
+
+def load_documents(limit: int) -> List[str]:
+    with db_context() as db:
+        minutes = db.query(Minute).order_by(Minute.id.desc()).limit(limit)
+        return [get_minute_document(minute) for minute in minutes]
+
+
+def main(
+    terms: str = "hús,bílskúr,svalir,breyting",
+    documents: int = 15,
+    pages: int = 200,
+):
+    highlight_terms = get_highlight_terms(terms.split(","))
+    _documents = load_documents(documents)
+    print(f"{len(_documents)} documents, {len(highlight_terms)} highlight terms")
+
+    for document in _documents:
+        matcher = get_highlight_matcher(highlight_terms)
+        assert list(matcher.iter_spans(document, 3)) == legacy_spans(
+            document, highlight_terms
+        )
+
+    def legacy():
+        for document in _documents:
+            legacy_spans(document, highlight_terms)
+
+    def precompiled():
+        matcher = get_highlight_matcher(highlight_terms)
+        for document in _documents:
+            list(matcher.iter_spans(document, 3))
+
+    def previews():
+        matcher = get_highlight_matcher(highlight_terms)
+        for document in _documents:
+            list(iter_preview_fragments(document, matcher))
+
+    for name, func in [
+        ("legacy spans", legacy),
+        ("matcher spans", precompiled),
+        ("matcher previews", previews),
+    ]:
+        seconds = timeit.timeit(func, number=pages)
+        print(f"{name:>16}: {seconds / pages * 1000:.3f} ms/page")
+
+
+if __name__ == "__main__":
+    typer.run(main)
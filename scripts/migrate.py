@@ -53,6 +53,7 @@ def sync(
         from sqlalchemy_utils import register_composites
 
         engine.execute("CREATE EXTENSION IF NOT EXISTS earthdistance CASCADE;")
+        engine.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
         engine.execute(
             "CREATE TYPE entity_mention_type AS "
             "(entity_id VARCHAR, start INTEGER, end_ INTEGER);"
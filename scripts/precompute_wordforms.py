@@ -0,0 +1,7 @@
+from planitor.language.wordforms import precompute_wordforms
+
+if __name__ == "__main__":
+    from planitor.database import db_context
+
+    with db_context() as db:
+        print(f"Stored word forms of {precompute_wordforms(db)} lexemes")
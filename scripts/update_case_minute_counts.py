@@ -0,0 +1,7 @@
+from planitor.crud import update_case_minute_counts
+
+if __name__ == "__main__":
+    from planitor.database import db_context
+
+    with db_context() as db:
+        print(f"Recounted the minutes of {update_case_minute_counts(db)} cases")
@@ -0,0 +1,8 @@
+from planitor.crud import update_meeting_status_counts
+
+if __name__ == "__main__":
+    from planitor.database import db_context
+
+    with db_context() as db:
+        count = update_meeting_status_counts(db)
+        print(f"Recounted the minute statuses of {count} meetings")
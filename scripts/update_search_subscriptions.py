@@ -0,0 +1,9 @@
+from planitor.crud import update_search_subscriptions
+
+if __name__ == "__main__":
+    from planitor.database import db_context
+
+    with db_context() as db:
+        print(
+            f"Compiled the queries of {update_search_subscriptions(db)} subscriptions"
+        )
@@ -27,11 +27,15 @@ def engine_fixture() -> sqlalchemy.engine.Engine:
 def db_fixture(engine):
 
     from planitor import models  # noqa
+    from planitor.cache import cache
     from planitor.database import Base, SessionLocal, engine
+    from planitor.mail import fragment_cache
 
     assert "planitor_test" in str(engine.url)
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(engine)
+    cache.clear()
+    fragment_cache.clear()
     db = SessionLocal()
     yield db
     db.close()
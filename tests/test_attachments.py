@@ -4,6 +4,7 @@ from io import BytesIO
 import pytest
 
 from planitor import attachments
+from planitor.cache import cache
 from planitor.models import PDFAttachment
 
 # PDF with three pages, each page a different color tile for easier debugging
@@ -33,3 +34,6 @@ def test_update_pdf_attachment(db, attachment, mock_get_url_bytestring, mocker):
     assert byte_string.closed
     assert key == "development/attachments/1.pdf"
     assert db.query(PDFAttachment).count() == 1
+    minute = attachment.minute
+    groups = [f"page:meeting:{minute.meeting_id}", f"page:case:{minute.case_id}"]
+    assert cache.get_generations(groups) == [1, 1]
@@ -0,0 +1,41 @@
+import redis
+
+from planitor.cache import Cache, MemoryBackend
+
+
+def test_cache_generations_survive_eviction():
+    cache = Cache(MemoryBackend(maxsize=1))
+    key = cache.versioned_key("search", "hús")
+    cache.set(key, {"ids": [1]})
+    assert cache.get(key) == {"ids": [1]}
+
+    cache.bump_generation("search")
+    assert cache.versioned_key("search", "hús") != key
+    cache.set("other", 1)
+    cache.set("another", 2)
+    assert cache.get("other") is None
+    assert cache.get_generation("search") == 1
+
+
+class DownBackend:
+    def get(self, key, *args):
+        raise redis.ConnectionError("down")
+
+    set = incr = get_many = get
+
+
+def test_cache_down():
+    cache = Cache(DownBackend())
+    cache.set("key", 1)
+    assert cache.get("key") is None
+    assert cache.get_generation("search") == 0
+    assert cache.bump_generation("search") == 0
+
+
+def test_cache_get_generations():
+    cache = Cache(MemoryBackend())
+    cache.bump_generation("a")
+    cache.bump_generation("a")
+    cache.bump_generation("c")
+    assert cache.get_generations(["a", "b", "c"]) == [2, 0, 1]
+    assert Cache(DownBackend()).get_generations(["a", "b"]) is None
@@ -1,10 +1,15 @@
 from planitor.models.city import Municipality
 from planitor.crud import (
+    create_minute,
+    get_company_lookup_index,
     get_or_create_entity,
+    levenshtein_company_lookup,
+    lookup_icelandic_companies_in_entities,
     lookup_icelandic_company_in_entities,
     update_case_address,
+    update_case_minute_counts,
 )
-from planitor.models import Geoname, Housenumber
+from planitor.models import Geoname, Housenumber, Minute
 from planitor.utils.kennitala import Kennitala
 
 
@@ -17,6 +22,52 @@ def test_lookup_in_entities(db):
     assert lookup_icelandic_company_in_entities(db, name).first() == entity
 
 
+def test_lookup_many_in_entities(db):
+    entity, _ = get_or_create_entity(
+        db, Kennitala("6301692919"), name="Plúsarkitektar ehf.", address=""
+    )
+    for kennitala in ("5012131870", "6204830369"):
+        get_or_create_entity(db, Kennitala(kennitala), name="Veitur ohf.", address="")
+    db.commit()
+    assert lookup_icelandic_companies_in_entities(
+        db, ["plúsarkitektar ehf", "Veitur ohf.", "Foo ehf."]
+    ) == {"plúsarkitektar ehf": entity}
+
+
+def test_levenshtein_company_lookup(db):
+    veitur, _ = get_or_create_entity(
+        db, Kennitala("5012131870"), name="Veitur ohf.", address=""
+    )
+    get_or_create_entity(
+        db, Kennitala("6301692919"), name="Plúsarkitektar ehf.", address=""
+    )
+    db.commit()
+    # An inflection, should match the slug in the database
+    assert levenshtein_company_lookup(db, "Veitum ohf").all() == [(veitur, 1)]
+    assert get_company_lookup_index(db).lookup("veitum-ohf") == [(veitur, 1)]
+
+
+def test_create_minute_counts_minutes(db, meeting):
+    items = {"case_serial": "bar", "case_address": None, "headline": "Bar"}
+    minute = create_minute(db, meeting, **items)
+    db.commit()
+    assert minute.case.minute_count == 1
+    create_minute(db, meeting, **items)
+    db.commit()
+    db.refresh(minute.case)
+    assert minute.case.minute_count == 2
+
+
+def test_update_case_minute_counts(db, minute):
+    db.add(Minute(meeting=minute.meeting, case=minute.case, headline="Other"))
+    db.commit()
+    assert minute.case.minute_count == 0
+    assert update_case_minute_counts(db) == 1
+    db.refresh(minute.case)
+    assert minute.case.minute_count == 2
+    assert update_case_minute_counts(db) == 0
+
+
 def test_geo(db, case):
     geoname = Geoname(osm_id=1, name="Barmahlíð", city="Reykjavík")
     db.add(geoname)
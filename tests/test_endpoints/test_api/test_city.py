@@ -0,0 +1,31 @@
+import datetime as dt
+
+from planitor.database import get_db
+from planitor.endpoints.api import router
+from planitor.models import CaseEntity
+
+
+def test_get_entity_addresses_etag(db, app, client, minute, company):
+    app.include_router(router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: db
+    case = minute.case
+    case.updated = minute.meeting.start
+    db.add(CaseEntity(case_id=case.id, entity=company, applicant=True))
+    db.commit()
+
+    url = f"/api/entities/{company.kennitala}/addresses"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert len(response.json()["addresses"]) == 1
+    assert response.headers["cache-control"].startswith("public")
+    etag = response.headers["etag"]
+
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    case.updated += dt.timedelta(days=1)
+    db.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
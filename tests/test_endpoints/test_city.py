@@ -0,0 +1,132 @@
+import datetime as dt
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from starlette.staticfiles import StaticFiles
+
+from planitor import hashids
+from planitor.cache import cache
+from planitor.database import get_db
+from planitor.endpoints import city
+from planitor.models import (
+    Attachment,
+    Case,
+    CaseEntity,
+    Entity,
+    EntityTypeEnum,
+    Meeting,
+    Minute,
+    Response,
+)
+
+
+@contextmanager
+def count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(name="pages")
+def pages_fixture(db, app, client, minute):
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.mount("/dist", StaticFiles(directory="dist"), name="dist")
+    app.include_router(city.router)
+    app.dependency_overrides[get_db] = lambda: db
+    return client
+
+
+def add_minutes(db, minute_id, start, stop):
+    """Add minutes with responses and attachments to the case of a minute, each in a
+    new meeting and with a new entity, and to the meeting of the minute, each about
+    a new case."""
+    minute = db.query(Minute).get(minute_id)
+    case = minute.case
+    for i in range(start, stop):
+        kennitala = f"{4602070880 + i * 1000}"
+        entity = Entity(
+            kennitala=kennitala,
+            name=f"Félag {i} ehf.",
+            entity_type=EntityTypeEnum.company,
+        )
+        db.add(CaseEntity(case_id=case.id, entity=entity, applicant=bool(i % 2)))
+        meeting = Meeting(
+            council=minute.meeting.council,
+            name=str(i + 2),
+            start=minute.meeting.start + dt.timedelta(days=i + 1),
+        )
+        other_case = Case(municipality=case.municipality, serial=f"other-{i}")
+        for current in (
+            Minute(meeting=meeting, case=case, serial=f"{i}", headline="A"),
+            Minute(
+                meeting=minute.meeting, case=other_case, serial=f"{i}", headline="B"
+            ),
+        ):
+            current.responses = [Response(contents="Svar", order=0)]
+            current.attachments = [Attachment(url=f"https://a/{i}", type="pdf")]
+            db.add(current)
+    case.updated = minute.meeting.start + dt.timedelta(days=stop)
+    case.minute_count = stop + 1
+    db.commit()
+    db.expunge_all()
+
+
+def get_query_count(db, pages, url):
+    with count_queries(db.get_bind()) as statements:
+        response = pages.get(url)
+    assert response.status_code == 200, response.text
+    return len(statements)
+
+
+@pytest.mark.parametrize(
+    "get_url",
+    [
+        lambda m: "/s/{}/{}/fundir/{}".format(
+            m.case.municipality.slug,
+            m.meeting.council.council_type.value,
+            hashids.encode(m.meeting_id),
+        ),
+        lambda m: "/s/{}/nr/{}".format(m.case.municipality.slug, m.case.serial),
+        lambda m: "/s/{}/nr/{}/{}".format(
+            m.case.municipality.slug, m.case.serial, hashids.encode(m.id)
+        ),
+    ],
+    ids=["meeting", "case", "minute"],
+)
+def test_page_query_count_does_not_grow(db, pages, minute, get_url):
+    url, minute_id = get_url(minute), minute.id
+    add_minutes(db, minute_id, 0, 1)
+    few = get_query_count(db, pages, url)
+    assert few <= 10
+
+    # Rendered pages are cached, so start over
+    cache.clear()
+    add_minutes(db, minute_id, 1, 6)
+    assert get_query_count(db, pages, url) == few
+
+
+def test_get_minute_neighbours(db, pages, minute):
+    first, middle, last = minute, *(
+        Minute(meeting=minute.meeting, case=minute.case, serial=str(i), headline="A")
+        for i in range(2)
+    )
+    db.add_all([middle, last])
+    db.commit()
+
+    url = "/s/{}/nr/{}/{}"
+    slug, serial = minute.case.municipality.slug, minute.case.serial
+    response = pages.get(url.format(slug, serial, hashids.encode(middle.id)))
+    assert url.format(slug, serial, hashids.encode(first.id)) in response.text
+    assert url.format(slug, serial, hashids.encode(last.id)) in response.text
+
+    response = pages.get(url.format(slug, serial, hashids.encode(first.id)))
+    assert url.format(slug, serial, hashids.encode(middle.id)) in response.text
+    assert url.format(slug, serial, hashids.encode(last.id)) not in response.text
@@ -1,4 +1,10 @@
-from planitor.geo import get_address_lookup_params, lookup_address
+from planitor.geo import (
+    earth_point,
+    get_address_lookup_params,
+    lookup_address,
+    within_radius,
+)
+from planitor.models import Address
 
 
 def test_get_address_lookup_params():
@@ -49,3 +55,24 @@ def test_lookup_address_matches_sernafn():
     assert match
     assert match["heiti_nf"] == "Austurbakki"
     assert match["husnr"]
+
+
+def test_within_radius(db):
+    db.add_all(
+        [
+            Address(hnitnum=1, lat_wgs84=64.1466, long_wgs84=-21.9426),
+            Address(hnitnum=2, lat_wgs84=64.1475, long_wgs84=-21.9426),  # ~100m north
+            Address(hnitnum=3, lat_wgs84=64.1466, long_wgs84=-21.9300),  # ~600m east
+        ]
+    )
+    db.commit()
+
+    def nearby(radius):
+        origin = earth_point(64.1466, -21.9426)
+        point = earth_point(Address.lat_wgs84, Address.long_wgs84)
+        query = db.query(Address.hnitnum).filter(within_radius(origin, point, radius))
+        return sorted(hnitnum for hnitnum, in query)
+
+    assert nearby(50) == [1]
+    assert nearby(200) == [1, 2]
+    assert nearby(1000) == [1, 2, 3]
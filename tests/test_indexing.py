@@ -0,0 +1,78 @@
+import pytest
+
+from planitor import indexing
+from planitor.models import Minute
+
+
+def fake_lemmatize_texts(texts, max_workers, raise_errors=False):
+    return [text.rstrip(".").lower().split() for text in texts]
+
+
+def test_reindex_minutes(db, minute, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexing, "lemmatize_texts", fake_lemmatize_texts)
+    other = Minute(meeting=minute.meeting, case=minute.case, headline="Other minute")
+    db.add(other)
+    db.commit()
+
+    checkpoint = indexing.Checkpoint(tmp_path / "checkpoint.json")
+    batches = []
+    progress = indexing.reindex_minutes(
+        db,
+        batch_size=1,
+        checkpoint=checkpoint,
+        on_batch=lambda ids, progress: batches.append(ids),
+    )
+
+    assert batches == [[other.id], [minute.id]]
+    assert (progress.done, progress.indexed) == (2, 2)
+    assert not checkpoint.path.exists()
+    assert db.query(Minute).get(minute.id).lemmas.startswith("minute")
+    assert db.query(Minute.id).filter(Minute.search_vector.match("other")).all() == [
+        (other.id,)
+    ]
+
+
+def test_reindex_minutes_resumes_from_checkpoint(db, minute, tmp_path, monkeypatch):
+    monkeypatch.setattr(indexing, "lemmatize_texts", fake_lemmatize_texts)
+    checkpoint = indexing.Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.save(last_id=minute.id, done=10, indexed=5)
+
+    progress = indexing.reindex_minutes(db, checkpoint=checkpoint)
+    assert (progress.done, progress.indexed) == (10, 5)
+    assert db.query(Minute).get(minute.id).lemmas is None
+
+
+def test_reindex_minutes_skips_unchanged(db, minute, monkeypatch):
+    monkeypatch.setattr(indexing, "lemmatize_texts", fake_lemmatize_texts)
+    assert indexing.reindex_minutes(db).indexed == 1
+    assert db.query(Minute).get(minute.id).index_hash is not None
+    assert indexing.reindex_minutes(db).indexed == 0
+
+    minute.remarks = "Changed"
+    db.commit()
+    assert indexing.reindex_minutes(db).indexed == 1
+    assert indexing.reindex_minutes(db, force=True).indexed == 1
+
+
+def test_reindex_minutes_force_ignores_unforced_checkpoint(
+    db, minute, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(indexing, "lemmatize_texts", fake_lemmatize_texts)
+    checkpoint = indexing.Checkpoint(tmp_path / "checkpoint.json")
+    checkpoint.save(last_id=minute.id, done=10, indexed=5)
+
+    progress = indexing.reindex_minutes(db, force=True, checkpoint=checkpoint)
+    assert (progress.done, progress.indexed) == (1, 1)
+    assert db.query(Minute).get(minute.id).lemmas is not None
+
+
+def test_reindex_minutes_stops_on_lemma_api_error(db, minute, tmp_path, monkeypatch):
+    def failing_lemmatize_texts(texts, max_workers, raise_errors):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(indexing, "lemmatize_texts", failing_lemmatize_texts)
+    checkpoint = indexing.Checkpoint(tmp_path / "checkpoint.json")
+    with pytest.raises(ConnectionError):
+        indexing.reindex_minutes(db, checkpoint=checkpoint)
+    assert not checkpoint.path.exists()
+    assert db.query(Minute).get(minute.id).index_hash is None
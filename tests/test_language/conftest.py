@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture(name="mock_lookup")
+def mock_lookup_fixture(monkeypatch):
+    """Replace the batch lookup `module.name` with one mapping each key to
+    `value(key)`. Returns the list of keys of each call."""
+
+    def mock(module, name, value):
+        calls = []
+
+        def lookup(keys, **kwargs):
+            keys = list(keys)
+            calls.append(keys)
+            return {key: value(key) for key in keys}
+
+        monkeypatch.setattr(module, name, lookup)
+        return calls
+
+    return mock
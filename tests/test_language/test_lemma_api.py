@@ -0,0 +1,68 @@
+import pytest
+
+from planitor.language import lemma_api
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def post(self, url, json, timeout):
+        self.calls.append((url, json))
+        if url.endswith("/api/batch"):
+            return FakeResponse(
+                {"results": [{"word": w, "lemmas": [w.lower()]} for w in json["words"]]}
+            )
+        return FakeResponse({"lemmas": json["text"].lower().split()})
+
+
+def test_lemmatize_batch_chunks_words(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(lemma_api, "_session", session)
+    monkeypatch.setattr(lemma_api, "BATCH_SIZE", 2)
+    results = lemma_api.lemmatize_batch(["A", "B", "C"])
+    assert [r["lemmas"] for r in results] == [["a"], ["b"], ["c"]]
+    assert len(session.calls) == 2
+
+
+def test_lemmatize_words_sends_distinct_words(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(lemma_api, "_session", session)
+    assert lemma_api.lemmatize_words(["Hús", "Hús", " ", "Gata"]) == {
+        "Hús": ["hús"],
+        "Gata": ["gata"],
+    }
+    assert session.calls == [
+        ("https://lemma.solberg.is/api/batch", {"words": ["Hús", "Gata"]})
+    ]
+
+
+def test_lemmatize_texts_preserves_order(monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(lemma_api, "_session", session)
+    texts = [f"Skjal {i}" for i in range(20)]
+    assert lemma_api.lemmatize_texts(texts, max_workers=4) == [
+        ["skjal", str(i)] for i in range(20)
+    ]
+
+
+def test_lemmatize_text_raise_errors(monkeypatch):
+    class FailingSession:
+        def post(self, url, json, timeout):
+            raise lemma_api.requests.ConnectionError("down")
+
+    monkeypatch.setattr(lemma_api, "_session", FailingSession())
+    assert lemma_api.lemmatize_text("Skjal") == []
+    with pytest.raises(lemma_api.requests.ConnectionError):
+        lemma_api.lemmatize_text("Skjal", raise_errors=True)
@@ -0,0 +1,45 @@
+from planitor.language import lemma_api
+from planitor.language.lemma_cache import LemmaCache, LRUCache
+from planitor.models import CachedLemma
+
+
+def mock_lemmatize_words(mock_lookup):
+    return mock_lookup(lemma_api, "lemmatize_words", lambda word: [word.lower()])
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set_many({"a": ["a"], "b": ["b"]})
+    assert cache.get_many(["a"]) == {"a": ["a"]}
+    cache.set_many({"c": ["c"]})
+    assert cache.get_many(["a", "b", "c"]) == {"a": ["a"], "c": ["c"]}
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=-1)
+    cache.set_many({"a": ["a"]})
+    assert cache.get_many(["a"]) == {}
+    assert len(cache) == 0
+
+
+def test_lemma_cache_only_asks_api_about_unseen_words(mock_lookup):
+    calls = mock_lemmatize_words(mock_lookup)
+    cache = LemmaCache(persistent=False)
+    assert cache.lemmatize_words(["Hús", "Gata"]) == {"Hús": ["hús"], "Gata": ["gata"]}
+    assert cache.lemmatize_word("Hús") == ["hús"]
+    assert calls == [["Hús", "Gata"]]
+    assert cache.stats["misses"] == 2
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_lemma_cache_persists_lemmas(db, mock_lookup):
+    calls = mock_lemmatize_words(mock_lookup)
+    cache = LemmaCache()
+    assert cache.lemmatize_word("Hús") == ["hús"]
+    assert db.query(CachedLemma).get("Hús").lemmas == ["hús"]
+
+    # A fresh process only has the shared tier
+    cache = LemmaCache()
+    assert cache.lemmatize_word("Hús") == ["hús"]
+    assert cache.stats["db_hits"] == 1
+    assert calls == [["Hús"]]
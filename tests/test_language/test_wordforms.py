@@ -0,0 +1,40 @@
+from sqlalchemy import func
+
+from planitor.language import wordforms
+from planitor.language.wordforms import WordformCache, precompute_wordforms
+from planitor.models import Wordforms
+
+
+def mock_lookup_wordforms(mock_lookup):
+    return mock_lookup(wordforms, "lookup_wordforms", lambda term: [term, f"{term}s"])
+
+
+def test_wordform_cache_only_looks_up_unseen_terms(mock_lookup):
+    calls = mock_lookup_wordforms(mock_lookup)
+    cache = WordformCache(persistent=False)
+    assert cache.get_highlight_terms(["hús"]) == {"hús", "húss"}
+    assert cache.get_highlight_terms(["hús", "gata"]) == {
+        "hús",
+        "húss",
+        "gata",
+        "gatas",
+    }
+    assert calls == [["hús"], ["gata"]]
+
+
+def test_wordform_cache_persists_forms(db, mock_lookup):
+    calls = mock_lookup_wordforms(mock_lookup)
+    WordformCache().get_wordforms(["hús"])
+    assert db.query(Wordforms).get("hús").forms == ["hús", "húss"]
+    assert WordformCache().get_wordforms(["hús"]) == {"hús": ["hús", "húss"]}
+    assert calls == [["hús"]]
+
+
+def test_precompute_wordforms(db, minute, mock_lookup):
+    calls = mock_lookup_wordforms(mock_lookup)
+    minute.search_vector = func.to_tsvector("simple", "hús gata")
+    db.add(Wordforms(lemma="hús", forms=["hús"]))
+    db.commit()
+    assert precompute_wordforms(db) == 1
+    assert calls == [["gata"]]
+    assert db.query(Wordforms).get("gata").forms == ["gata", "gatas"]
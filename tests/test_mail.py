@@ -0,0 +1,110 @@
+import smtplib
+from contextlib import contextmanager
+
+import pytest
+
+from planitor import mail
+
+
+class FakePool:
+    def __init__(self):
+        self.connections = 0
+
+    @contextmanager
+    def connection(self):
+        self.connections += 1
+        yield None
+
+
+def create_email(email_to="foo@bar.com"):
+    return mail.create_email(
+        email_to, "Test", "subscription_weekly.html", {"meeting_minute_deliveries": []}
+    )
+
+
+def test_deliver_retries_transient_errors(emails_message_send):
+    emails_message_send.side_effect = [smtplib.SMTPServerDisconnected(), "ok"]
+    email = create_email()
+    pool = FakePool()
+    assert mail.deliver(email, pool, retries=1, backoff=0) == "ok"
+    assert pool.connections == 2
+
+
+def test_deliver_does_not_retry_refused_recipients(emails_message_send):
+    error = smtplib.SMTPRecipientsRefused({"foo@bar.com": (550, b"No such user")})
+    emails_message_send.side_effect = error
+    email = create_email()
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        mail.deliver(email, FakePool(), retries=3, backoff=0)
+    assert emails_message_send.call_count == 1
+
+
+def test_mail_dispatcher(emails_message_send):
+    emails_message_send.side_effect = lambda to, **kwargs: f"sent to {to}"
+    batches = []
+    with mail.MailDispatcher(
+        batches.append, workers=2, batch_size=2, pool=FakePool()
+    ) as dispatcher:
+        for i in range(5):
+            dispatcher.submit(create_email(f"{i}@bar.com"), i)
+
+    assert all(len(batch) >= 2 for batch in batches[:-1])
+    assert sorted(pair for batch in batches for pair in batch) == [
+        (i, f"sent to {i}@bar.com") for i in range(5)
+    ]
+
+
+def test_minute_fragment_is_rendered_once(db, minute, subscription):
+    from planitor.models import Delivery
+    from planitor.monitor import create_meeting_email
+
+    minute.headline = "Bílskúr"
+    delivery = Delivery(minute=minute, subscription=subscription)
+    email = create_meeting_email(
+        subscription.user, minute.meeting, [(minute, [delivery])]
+    )
+    assert "Bílskúr" in email.message.html
+
+    # The minute body comes from the fragment cache, the footer is rendered anew
+    minute.headline = "Hús"
+    email = create_meeting_email(
+        subscription.user, minute.meeting, [(minute, [delivery])]
+    )
+    assert "Bílskúr" in email.message.html
+    assert "Hús" not in email.message.html
+    assert subscription.get_string() in email.message.html
+
+
+def test_mail_dispatcher_records_permanent_failures(emails_message_send, monkeypatch):
+    monkeypatch.setattr(mail.time, "sleep", lambda seconds: None)
+
+    def send(to, **kwargs):
+        if to == "refused@bar.com":
+            raise smtplib.SMTPRecipientsRefused({to: (550, b"No such user")})
+        if to == "auth@bar.com":
+            raise smtplib.SMTPAuthenticationError(535, b"Bad credentials")
+        raise smtplib.SMTPServerDisconnected()
+
+    emails_message_send.side_effect = send
+    batches = []
+    with mail.MailDispatcher(batches.append, workers=2, pool=FakePool()) as dispatcher:
+        dispatcher.submit(create_email("refused@bar.com"), "refused")
+        dispatcher.submit(create_email("down@bar.com"), "down")
+        dispatcher.submit(create_email("auth@bar.com"), "auth")
+
+    [(key, response)] = [pair for batch in batches for pair in batch]
+    assert key == "refused"
+    assert response.startswith("failed: SMTPRecipientsRefused")
+
+
+def test_smtp_pool_returns_slot_when_backend_fails(monkeypatch):
+    def get_smtp_options():
+        raise KeyError("SMTP_PORT")
+
+    monkeypatch.setattr(mail, "get_smtp_options", get_smtp_options)
+    pool = mail.SMTPPool(size=1)
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            with pool.connection():
+                pass
+    assert pool._backends.qsize() == 1
@@ -0,0 +1,69 @@
+import datetime as dt
+import threading
+import time
+
+from planitor.map_index import CaseGrid, get_distance
+from planitor.models import Address, Case, CaseStatusEnum, Minute
+
+
+def test_get_distance():
+    # About 100m between two points a thousandth of a degree of latitude apart
+    assert 110 < get_distance(64.143, -21.909, 64.144, -21.909) < 112
+
+
+def test_case_grid(db, address, case, meeting):
+    now = dt.datetime.utcnow()
+    case.updated = now - dt.timedelta(days=2)
+    case.status = CaseStatusEnum.approved
+    db.add(Minute(case=case, meeting=meeting, headline="Foo"))
+    db.commit()
+
+    grid = CaseGrid()
+    assert grid.refresh(db) == 1
+    lat, lon = float(address.lat_wgs84), float(address.long_wgs84)
+
+    (location,) = grid.query(lat, lon, 10, now - dt.timedelta(days=30))
+    assert location.hnitnum == address.hnitnum
+    assert location.label == str(address)
+    assert location.status == CaseStatusEnum.approved
+    assert grid.query(lat, lon, 10, now - dt.timedelta(days=1)) == []
+
+    # A new case with minutes about 200m north, picked up by an incremental refresh
+    nearby = Address(hnitnum=2, lat_wgs84=lat + 0.0018, long_wgs84=lon)
+    nearby_case = Case(
+        municipality=case.municipality, iceaddr=nearby, serial="bar", updated=now
+    )
+    db.add(Minute(case=nearby_case, meeting=meeting, headline="Bar"))
+    db.commit()
+    assert grid.refresh(db) == 1
+    assert len(grid) == 2
+
+    since = now - dt.timedelta(days=30)
+    assert [loc.hnitnum for loc in grid.query(lat, lon, 100, since)] == [
+        address.hnitnum
+    ]
+    assert [loc.hnitnum for loc in grid.query(lat, lon, 300, since)] == [
+        2,
+        address.hnitnum,
+    ]
+    assert len(grid.query(lat, lon, 300, since, limit=1)) == 1
+
+
+def test_case_grid_refreshes_once_for_concurrent_requests(monkeypatch):
+    grid = CaseGrid()
+    refreshes = []
+
+    def refresh(db, full=False):
+        refreshes.append(full)
+        time.sleep(0.05)
+        grid.refreshed = grid.reloaded = time.monotonic()
+
+    monkeypatch.setattr(grid, "refresh", refresh)
+    threads = [
+        threading.Thread(target=grid.refresh_if_stale, args=(None,)) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert refreshes == [True]
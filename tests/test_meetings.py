@@ -0,0 +1,19 @@
+from planitor.crud import update_meeting_status_counts
+from planitor.meetings import MeetingView, NoneEnum
+from planitor.models import CaseStatusEnum, Council, Minute
+
+
+def test_meeting_view(db, minute):
+    minute.status = CaseStatusEnum.approved
+    db.add(Minute(meeting=minute.meeting, case=minute.case, headline="Other"))
+    db.commit()
+    assert update_meeting_status_counts(db, [minute.meeting_id]) == 1
+
+    municipality_id = minute.meeting.council.municipality_id
+    (meeting,) = MeetingView(db, None, Council.municipality_id == municipality_id)
+    assert meeting.name == minute.meeting.name
+    assert meeting.counts[CaseStatusEnum.approved] == 1
+    assert meeting.counts[CaseStatusEnum.denied] == 0
+    assert meeting.minute_count == 2
+    counts = meeting.counts.items()
+    assert [count for enum, count in counts if isinstance(enum, NoneEnum)] == [1]
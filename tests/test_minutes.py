@@ -1,4 +1,10 @@
-from planitor.minutes import get_minute_document, get_minute_lemmas, search
+from planitor import minutes
+from planitor.minutes import (
+    get_minute_document,
+    get_minute_index_hash,
+    get_minute_lemmas,
+    search,
+)
 from planitor.models import Case, CaseEntity, Entity, Minute, Response
 
 
@@ -19,7 +25,7 @@ def test_get_minute_lemmas(monkeypatch, address):
         remarks="Málinu vísað", case=Case(serial="foo", address="bar", iceaddr=address)
     )
 
-    def mock_get_lemmas(text, ignore):
+    def mock_get_lemmas(text, ignore, raise_errors=False):
         for fragment in text.split():
             yield fragment
 
@@ -36,3 +42,18 @@ def test_get_minute_lemmas(monkeypatch, address):
         "Laugavegur",
         "foo",
     ]
+
+
+def test_get_minute_index_hash(monkeypatch, address):
+    minute = Minute(headline="Foo", case=Case(serial="foo", iceaddr=address))
+    index_hash = get_minute_index_hash(minute)
+    assert get_minute_index_hash(minute) == index_hash
+
+    minute.case.entities = [CaseEntity(entity=Entity(name="Big Cheese ltd."))]
+    assert get_minute_index_hash(minute) != index_hash
+    minute.case.entities = []
+
+    monkeypatch.setattr(minutes, "INDEX_VERSION", minutes.INDEX_VERSION + 1)
+    minutes.get_index_version.cache_clear()
+    assert get_minute_index_hash(minute) != index_hash
+    minutes.get_index_version.cache_clear()
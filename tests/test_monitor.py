@@ -1,8 +1,13 @@
+from datetime import timedelta
+
 from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 
 from planitor import monitor
-from planitor.crud import get_or_create_search_subscription
+from planitor.crud import (
+    get_or_create_search_subscription,
+    update_search_subscriptions,
+)
 from planitor.minutes import get_minute_lemmas
 from planitor.models import (
     Address,
@@ -96,6 +101,22 @@ def test_match_minute_search(db, minute, user):
     assert list(monitor.match_minute(db, minute)) == [subscription]
 
 
+def test_match_minute_compiled_search(db, minute, user):
+    minute.search_vector = func.to_tsvector("simple", "klæða álplata á hús")
+    matching, negated, other = (
+        Subscription(user=user, type=SubscriptionTypeEnum.search, search_lemmas=lemmas)
+        for lemmas in ("álplata hús", "-gips", "gips")
+    )
+    db.add_all([minute, matching, negated, other])
+    db.commit()
+    assert update_search_subscriptions(db) == 3
+    db.refresh(matching)
+    db.refresh(negated)
+    assert sorted(matching.search_lexemes) == ["hús", "álplata"]
+    assert negated.search_lexemes == []
+    assert set(monitor.match_minute(db, minute)) == {matching, negated}
+
+
 def test_get_unsent_deliveries(db: Session, user, case, meeting, minute, subscription):
     # User has one subscription/delivery, User 2 has two subscriptions/deliveries
     user_2 = User(email="foo")
@@ -157,3 +178,88 @@ def test_match_minute_matches_with_council_subscriptions_set(
     db.add(subscription)
     db.commit()
     assert list(monitor.match_minute(db, minute)) == [subscription]
+
+
+def test_match_meeting(db, minute, user, case, company):
+    other_case = Case(municipality=case.municipality, serial="bar")
+    other_minute = Minute(case=other_case, meeting=minute.meeting, headline="Bar")
+    other_case.entities.append(CaseEntity(entity=company))
+    by_case = Subscription(user=user, case=case, type=SubscriptionTypeEnum.case)
+    by_address = Subscription(
+        user=user, address=case.iceaddr, type=SubscriptionTypeEnum.address
+    )
+    by_entity = Subscription(
+        user=user, entity=company, type=SubscriptionTypeEnum.entity
+    )
+    inactive = Subscription(
+        user=user, case=other_case, type=SubscriptionTypeEnum.case, active=False
+    )
+    db.add_all([other_minute, by_case, by_address, by_entity, inactive])
+    db.commit()
+
+    assert set(monitor.match_meeting(db, minute.meeting_id)) == {
+        (by_case.id, minute.id),
+        (by_address.id, minute.id),
+        (by_entity.id, other_minute.id),
+    }
+
+
+def test_create_meeting_deliveries(db, minute, subscription):
+    delivery_ids = monitor._create_meeting_deliveries(db, minute.meeting_id)
+    assert len(delivery_ids) == 1
+    delivery = db.query(Delivery).get(delivery_ids[0])
+    assert (delivery.subscription, delivery.minute) == (subscription, minute)
+
+    # Retrying does not duplicate deliveries
+    assert monitor._create_meeting_deliveries(db, minute.meeting_id) == []
+    assert db.query(Delivery).count() == 1
+
+
+def test_create_missing_deliveries(db, minute, subscription):
+    # Too fresh, its pipeline may still be running
+    assert monitor._create_missing_deliveries(db) == []
+
+    minute.meeting.created = func.now() - timedelta(hours=2)
+    db.commit()
+    assert len(monitor._create_missing_deliveries(db)) == 1
+    assert db.query(Delivery).one().subscription == subscription
+    assert monitor._create_missing_deliveries(db) == []
+
+
+def test_create_meeting_deliveries_of_several_subscriptions(
+    db, minute, user, subscription
+):
+    by_address = Subscription(
+        user=user, address=minute.case.iceaddr, type=SubscriptionTypeEnum.address
+    )
+    db.add(by_address)
+    db.commit()
+
+    assert len(monitor._create_meeting_deliveries(db, minute.meeting_id)) == 2
+    assert {d.subscription for d in db.query(Delivery)} == {subscription, by_address}
+
+
+def test_send_weekly_emails(db, minute, user, case, emails_message_send):
+    user_2 = User(email="foo@baz.com")
+    subscriptions = [
+        Subscription(user=_user, case=case, type=SubscriptionTypeEnum.case)
+        for _user in (user, user_2)
+    ]
+    for subscription in subscriptions:
+        subscription.immediate = False
+    db.add_all([Delivery(minute=minute, subscription=s) for s in subscriptions])
+    db.commit()
+
+    grouped = [
+        (_user, list(deliveries))
+        for _user, deliveries in get_unsent_deliveries(db, False, chunk_size=1)
+    ]
+    assert [(_user, len(deliveries)) for _user, deliveries in grouped] == [
+        (user, 1),
+        (user_2, 1),
+    ]
+
+    monitor._send_weekly_emails(db)
+    assert emails_message_send.call_count == 2
+    db.expire_all()
+    assert all(delivery.sent for delivery in db.query(Delivery))
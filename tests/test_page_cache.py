@@ -0,0 +1,90 @@
+import redis
+from fastapi import Request
+from starlette.responses import HTMLResponse
+
+from planitor import page_cache
+from planitor.models import CaseEntity
+from planitor.page_cache import (
+    NEW_MINUTES,
+    PageCache,
+    get_meeting_page_tags,
+    invalidate_pages,
+)
+
+
+def test_page_cache(db, app, client):
+    renders = []
+
+    @app.get("/cases/{id}")
+    def get_case(request: Request, id: int):
+        page = PageCache(request, [("case", id)])
+        response = page.get()
+        if response is None:
+            renders.append(id)
+            response = page.set(HTMLResponse(f"<p>{len(renders)}</p>"))
+        return response
+
+    response = client.get("/cases/1")
+    assert response.text == "<p>1</p>"
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    response = client.get("/cases/1")
+    assert response.text == "<p>1</p>"
+    assert response.headers["etag"] == etag
+    assert client.get("/cases/1", headers={"If-None-Match": etag}).status_code == 304
+    response = client.get("/cases/1", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    assert renders == [1]
+
+    # Only pages tagged with the case are rendered again
+    client.get("/cases/2")
+    invalidate_pages(("case", 1))
+    response = client.get("/cases/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.text == "<p>3</p>"
+    assert response.headers["etag"] != etag
+    client.get("/cases/2")
+    assert renders == [1, 2, 1]
+
+
+def test_page_cache_version_and_cache_down(db, app, client, monkeypatch):
+    renders = []
+
+    @app.get("/cases/{id}")
+    def get_case(request: Request, id: int):
+        page = PageCache(request, [("case", id)])
+        response = page.get()
+        if response is None:
+            renders.append(id)
+            response = page.set(HTMLResponse(f"<p>{len(renders)}</p>"))
+        return response
+
+    etag = client.get("/cases/1").headers["etag"]
+
+    # A new deploy renders the page again
+    monkeypatch.setattr(page_cache, "PAGE_VERSION", "next")
+    response = client.get("/cases/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+
+    # Old pages are not validated while generations can not be read
+    def get_many(keys):
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(page_cache.cache.backend, "get_many", get_many)
+    response = client.get("/cases/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+    assert renders == [1, 1, 1]
+
+
+def test_get_meeting_page_tags(db, minute, company):
+    db.add(CaseEntity(case_id=minute.case_id, entity=company, applicant=True))
+    db.commit()
+    assert set(get_meeting_page_tags(db, minute.meeting_id)) == {
+        ("meeting", minute.meeting_id),
+        ("case", minute.case_id),
+        ("address", minute.case.address_id),
+        ("entity", company.kennitala),
+        NEW_MINUTES,
+    }
@@ -1,5 +1,8 @@
-from planitor.models import Entity
-from planitor.postprocess import _update_minute_with_entity_mentions
+from planitor.models import CaseEntity, Entity, Minute
+from planitor.postprocess import (
+    _update_minute_with_entity_mentions,
+    _update_minutes_with_entity_mentions,
+)
 
 
 def test_update_minute_with_entity_mentions_creates_new_entity(db, minute):
@@ -34,3 +37,24 @@ def test_update_minute_with_entity_mentions_uses_existing_entity(db, minute, com
     assert len(minute.entity_mentions) == 1
     assert minute.case.entities[0].entity == company
     assert db.query(Entity).count() == 1
+
+
+def test_update_minutes_with_entity_mentions(db, minute, company):
+    other_minute = Minute(
+        case=minute.case,
+        meeting=minute.meeting,
+        headline="Foo",
+        inquiry="Bréf barst frá Veitum ohf. í dag.",
+    )
+    minute.inquiry = "Skjal barst frá Veitum ohf. í gær."
+    db.add(other_minute)
+    db.commit()
+
+    _update_minutes_with_entity_mentions(db, [minute, other_minute])
+    assert len(minute.entity_mentions) == 1
+    assert len(other_minute.entity_mentions) == 1
+    assert [ce.entity for ce in minute.case.entities] == [company]
+
+    # Running again neither fails on nor duplicates the existing case entity
+    _update_minutes_with_entity_mentions(db, [minute, other_minute])
+    assert db.query(CaseEntity).count() == 1
@@ -1,6 +1,14 @@
+import datetime as dt
+
 from markupsafe import Markup
+from sqlalchemy import func
 
-from planitor.search import get_terms_from_query, iter_preview_fragments
+from planitor import search
+from planitor.search import (
+    HighlightMatcher,
+    get_terms_from_query,
+    iter_preview_fragments,
+)
 
 LONG_WORD = "s" * 51
 LONG_SENTENCE = " ".join(["s" * 5] * 10)
@@ -56,7 +64,121 @@ def test_iter_preview_fragments_escapes_document():
     ]
 
 
+def test_highlight_matcher_matches_whole_words_only():
+    matcher = HighlightMatcher({"hús", "húsi", "hú", "gata"})
+    document = "Húsið og húsi við Hús, gatan og Gata."
+    assert [document[s:e] for s, e in matcher.iter_spans(document)] == [
+        "húsi við Hús, gatan og Gata"
+    ]
+
+
+def test_highlight_matcher_limits_spans():
+    matcher = HighlightMatcher({"b"})
+    document = f"b {LONG_SENTENCE} b {LONG_SENTENCE} b"
+    assert len(list(matcher.iter_spans(document))) == 3
+    assert len(list(matcher.iter_spans(document, max_spans=2))) == 2
+    assert list(HighlightMatcher(set()).iter_spans(document)) == []
+
+
 def test_iter_preview_fragments_joins_consecutive():
     assert list(iter_preview_fragments("A B C", {"b", "c"})) == [
         Markup("A <strong>B C</strong>")
     ]
+
+
+def test_minute_results_create(db, minute, loop, monkeypatch):
+    minute.search_vector = func.to_tsvector("simple", "hús")
+    db.add(minute)
+    db.commit()
+
+    monkeypatch.setattr(search, "lemmatize_query", lambda q: q.title())
+    monkeypatch.setattr(search, "get_address_hnitnums", lambda q: [])
+    results = loop.run_until_complete(search.MinuteResults.create(db, "hús", None))
+    assert results.lemmatized_query == "Hús"
+    assert results.minutes == [minute]
+    assert "hús" in results.highlight_terms
+    assert [m for m, _ in results] == [minute]
+
+
+def test_minute_results_relevance_order(db, minute, monkeypatch):
+    from planitor.models import Meeting, Minute, SearchOrderEnum
+
+    recent = Meeting(council=minute.meeting.council, name="2", start=dt.datetime.now())
+    minutes = [
+        Minute(meeting=minute.meeting, case=minute.case, headline="Old"),
+        Minute(meeting=recent, case=minute.case, headline="Weak"),
+        Minute(meeting=recent, case=minute.case, headline="Strong"),
+    ]
+    minutes[0].search_vector = func.to_tsvector("simple", "hús gata")
+    minutes[1].search_vector = func.to_tsvector("simple", "hús veggur þak gata")
+    minutes[2].search_vector = func.to_tsvector("simple", "hús gata")
+    db.add_all(minutes)
+    db.commit()
+
+    monkeypatch.setattr(search, "get_highlight_terms", lambda terms: set(terms))
+    results = search.MinuteResults(
+        db, "hús gata", None, "hús gata", [], order=SearchOrderEnum.relevance
+    )
+    assert [m.headline for m, _ in results] == ["Strong", "Weak", "Old"]
+    assert results.count == 3
+
+    search.invalidate_search_cache()
+    monkeypatch.setattr(search, "RANK_CANDIDATES", 2)
+    results = search.MinuteResults(
+        db, "hús gata", None, "hús gata", [], order=SearchOrderEnum.relevance
+    )
+    # Only the most recent matches are candidates
+    assert [m.headline for m, _ in results] == ["Strong", "Weak"]
+    assert results.count == 2
+
+
+def test_minute_results_keyset_pagination(db, minute, monkeypatch):
+    from planitor.models import Minute
+
+    minutes = [
+        Minute(meeting=minute.meeting, case=minute.case, headline=str(i))
+        for i in range(20)
+    ]
+    for m in minutes:
+        m.search_vector = func.to_tsvector("simple", "hús")
+    db.add_all(minutes)
+    db.commit()
+
+    monkeypatch.setattr(search, "get_highlight_terms", lambda terms: set(terms))
+    monkeypatch.setattr(search, "COUNT_LIMIT", 16)
+    results = search.MinuteResults(db, "hús", None, "hús", [])
+    first_page = [m for m, _ in results]
+    assert len(first_page) == 15
+    assert (results.count, results.count_capped) == (16, True)
+
+    results = search.MinuteResults(db, "hús", results.paging.bookmark_next, "hús", [])
+    assert [m for m, _ in results] == minutes[:5][::-1]
+    assert not results.paging.has_next
+    assert first_page + minutes[:5][::-1] == minutes[::-1]
+
+    # Old style numbered pages fall back to the first page
+    results = search.MinuteResults(db, "hús", "2", "hús", [])
+    assert [m for m, _ in results] == first_page
+
+
+def test_minute_results_cache(db, minute, monkeypatch):
+    minute.search_vector = func.to_tsvector("simple", "hús")
+    db.commit()
+    monkeypatch.setattr(search, "get_highlight_terms", lambda terms: set(terms))
+    results = search.MinuteResults(db, "Hús", None, "Hús", [])
+    assert results.minutes == [minute]
+    assert results.highlight_terms == {"hús"}
+
+    # Same tsquery, served from the cache without counting or paging again
+    monkeypatch.setattr(search, "get_page", None)
+    results = search.MinuteResults(db, "hús", None, "hús", [])
+    assert results.minutes == [minute]
+    assert (results.count, results.paging.has_next) == (1, False)
+    assert results.highlight_terms == {"hús"}
+
+    search.invalidate_search_cache()
+    monkeypatch.undo()
+    monkeypatch.setattr(search, "get_highlight_terms", lambda terms: set(terms))
+    minute.search_vector = func.to_tsvector("simple", "gata")
+    db.commit()
+    assert search.MinuteResults(db, "hús", None, "hús", []).minutes == []
@@ -0,0 +1,41 @@
+from planitor.utils.fuzzy import TrigramIndex, levenshtein, similarity, trigrams
+
+
+def test_trigrams():
+    # Same as `SELECT show_trgm('Veitur ohf.')`
+    assert trigrams("Veitur ohf.") == {
+        "  v", " ve", "vei", "eit", "itu", "tur", "ur ",
+        "  o", " oh", "ohf", "hf ",
+    }  # fmt: skip
+    assert trigrams("") == frozenset()
+
+
+def test_similarity():
+    assert similarity("veitur-ohf", "Veitur ohf.") == 1
+    assert similarity("veitur-ohf", "veitum-ohf") == 9 / 13
+    assert similarity("abc", "xyz") == 0
+
+
+def test_levenshtein():
+    assert levenshtein("veitur", "veitum") == 1
+    assert levenshtein("", "abc") == 3
+    assert levenshtein("kitten", "sitting") == 3
+    assert levenshtein("kitten", "sitting", max_distance=1) == 2
+    assert levenshtein("a", "abcdefgh", max_distance=3) == 4
+
+
+def test_trigram_index():
+    index = TrigramIndex(
+        [
+            ("veitur-ohf", "5012131870"),
+            ("veitur-ohf", "6204830369"),
+            ("plusarkitektar-ehf", "6301692919"),
+            ("reitir-fasteignafelag-hf", "6912071430"),
+        ]
+    )
+    assert len(index) == 3
+    assert index.candidates("veitum-ohf") == ["veitur-ohf"]
+    assert index.lookup("veitum-ohf") == [("5012131870", 1), ("6204830369", 1)]
+    assert index.lookup("plusarkitektar-ehf", max_distance=0) == [("6301692919", 0)]
+    assert index.lookup("veitum-ohf", max_distance=0) == []
+    assert index.lookup("byggingarfelag") == []